@@ -1,16 +1,106 @@
+import asyncio
 import contextlib
 import functools
+import heapq
 import inspect
+import itertools
 import time
-from threading import Lock
-from typing import Any, Callable, Dict, Iterable, List, Self
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Event, Lock
+from typing import Any, Callable, ClassVar, Deque, Dict, Iterable, List, Optional, Self, Tuple
 
+import numpy
 from attr import Factory, define, field
+from loguru import logger as log
 
-from Broken import BIG_BANG
+from Broken import BIG_BANG, BrokenEnum
 from Broken.Types import Hertz, Seconds
 
 
+class BrokenTaskExecutor(BrokenEnum):
+    """Where a task's calls are run, the scheduler always keeps their timing on its own thread"""
+    Main   = "main"
+    """On the scheduler's (caller's) thread, blocking it until the call returns"""
+    Pool   = "pool"
+    """On a thread pool shared by all tasks"""
+    Thread = "thread"
+    """On a dedicated thread of this task"""
+
+class BrokenTaskOverlap(BrokenEnum):
+    """What to do with a call that's due while the previous one of the same task is still running"""
+    Skip     = "skip"
+    """Drop the call, the task simply misses this deadline"""
+    Queue    = "queue"
+    """Run every call, one after the other in order"""
+    Coalesce = "coalesce"
+    """Keep only the latest of the waiting calls, run after the current one"""
+
+@define
+class BrokenTaskStats:
+    """
+    Optional timing instrumentation of a BrokenTask, on fixed-size rings of the latest calls
+
+    • Lateness: how long after its deadline a call was dispatched (oversleeping, busy scheduler)
+    • Duration: how long the task body itself took to run (slow tasks)
+    • A call is missed when it's dispatched a whole period or more late
+    """
+    size:   int = 1024
+    export: Callable[[Self], None] = None
+    """Called with the stats every time the rings wrap around, to persist or plot them"""
+
+    lateness: numpy.ndarray = None
+    duration: numpy.ndarray = None
+    calls:    int = 0
+    runs:     int = 0
+    missed:   int = 0
+    skipped:  int = 0
+
+    def __attrs_post_init__(self):
+        self.lateness = numpy.zeros(self.size, dtype=numpy.float64)
+        self.duration = numpy.zeros(self.size, dtype=numpy.float64)
+
+    def late(self, seconds: Seconds, period: Seconds) -> None:
+        """Record the lateness of a dispatched call"""
+        self.lateness[self.calls % self.size] = seconds
+        self.missed += (seconds >= period)
+        self.calls  += 1
+        if self.export and not (self.calls % self.size):
+            self.export(self)
+
+    def took(self, seconds: Seconds) -> None:
+        """Record the duration of a finished call"""
+        self.duration[self.runs % self.size] = seconds
+        self.runs += 1
+
+    @staticmethod
+    def percentiles(ring: numpy.ndarray, count: int) -> Dict[str, Seconds]:
+        """p50, p95, p99 and max of the filled part of a ring"""
+        if not (count := min(count, len(ring))):
+            return dict(p50=0, p95=0, p99=0, max=0)
+        p50, p95, p99 = numpy.percentile(ring[:count], (50, 95, 99))
+        return dict(p50=p50, p95=p95, p99=p99, max=ring[:count].max())
+
+    def summary(self) -> Dict[str, Any]:
+        return dict(
+            calls=self.calls,
+            missed=self.missed,
+            skipped=self.skipped,
+            lateness=self.percentiles(self.lateness, self.calls),
+            duration=self.percentiles(self.duration, self.runs),
+        )
+
+def _stats(value: Any) -> Optional[BrokenTaskStats]:
+    """Allow stats=True for default instrumentation"""
+    return BrokenTaskStats() if (value is True) else (value or None)
+
+def _reschedule(task: "BrokenTask", attribute: Any, value: Any) -> Any:
+    """attrs on_setattr hook, keeps the owning scheduler's heap in sync with the task"""
+    if (scheduler := task._scheduler) is not None:
+        object.__setattr__(task, attribute.name, value)
+        scheduler.__push__(task)
+    return value
+
 @define
 class BrokenTask:
     """
@@ -25,6 +115,9 @@ class BrokenTask:
     - lock:       Lock to use when calling task (with statement)
     - enabled:    Whether to enable this client or not
     - once:       Whether to call this client only once or not
+    - executor:   Thread to run task calls on, see BrokenTaskExecutor
+    - overlap:    Policy for calls due while the previous one runs, see BrokenTaskOverlap
+    - stats:      Optional lateness and duration instrumentation, see BrokenTaskStats
 
     # Synchronization
     - frequency:  Frequency of task calls
@@ -46,8 +139,11 @@ class BrokenTask:
     output:   Any            = field(default=None, repr=False)
     context:  Any            = None
     lock:     Lock           = None
-    enabled:  bool           = True
+    enabled:  bool           = field(default=True, on_setattr=_reschedule)
     once:     bool           = False
+    executor: BrokenTaskExecutor = BrokenTaskExecutor.Main.field()
+    overlap:  BrokenTaskOverlap  = BrokenTaskOverlap.Skip.field()
+    stats:    BrokenTaskStats    = field(default=None, converter=_stats, repr=False)
 
     # Synchronization
     frequency:  Hertz = 60.0
@@ -57,11 +153,20 @@ class BrokenTask:
 
     # Timing
     started:   Seconds = Factory(lambda: time.bang_counter())
-    next_call: Seconds = None
+    next_call: Seconds = field(default=None, on_setattr=_reschedule)
     last_call: Seconds = None
     _time:     bool    = False
     _dt:       bool    = False
 
+    # Scheduler the task was added to, notified of changes to enabled and next_call
+    _scheduler: Any = field(default=None, repr=False, eq=False)
+
+    # Off-thread execution state, calls waiting for the running one
+    _busy:    bool = False
+    _backlog: Deque[Dict[str, Any]] = Factory(deque)
+    _guard:   Lock = Factory(Lock)
+    _worker:  ThreadPoolExecutor = None
+
     def __attrs_post_init__(self):
         signature = inspect.signature(self.task)
         self._dt   = ("dt"   in signature.parameters)
@@ -128,34 +233,133 @@ class BrokenTask:
         now = self.next_call if self.decoupled else time.bang_counter()
         if self._dt:   self.kwargs["dt"]   = (now - self.last_call)
         if self._time: self.kwargs["time"] = (now - self.started)
+        if self.stats:
+            self.stats.late(0 if self.decoupled else max(0, now - self.next_call), self.period)
 
-        # Enter or not the given context, call task with args and kwargs
-        with (self.lock or contextlib.nullcontext()):
-            with (self.context or contextlib.nullcontext()):
-                self.output = self.task(*self.args, **self.kwargs)
+        # Call the task here or hand it over to its executor
+        if (self.executor == BrokenTaskExecutor.Main):
+            self.__call__(self.kwargs)
+        else:
+            self.__dispatch__(dict(self.kwargs))
 
         # Fixme: This is a better way to do it, but on decoupled it's not "dt perfect"
         # self.next_call = self.period * (math.floor(now/self.period) + 1)
 
-        # Update future and past states
+        # Update future and past states, assigning next_call once to reschedule once
         self.last_call = now
-        while self.next_call <= now:
-            self.next_call += self.period
+        next_call = self.next_call
+        while next_call <= now:
+            next_call += self.period
+        self.next_call = next_call
 
         # (Disabled && Once) clients gets deleted
         self.enabled = not self.once
+        if self.should_delete:
+            self.shutdown()
 
         return self
 
+    # # Execution
+
+    _pool = None
+
+    @staticmethod
+    def pool() -> ThreadPoolExecutor:
+        """Thread pool shared by all tasks with the Pool executor"""
+        if BrokenTask._pool is None:
+            BrokenTask._pool = ThreadPoolExecutor(thread_name_prefix="BrokenTask")
+        return BrokenTask._pool
+
+    def __call__(self, kwargs: Dict[str, Any]) -> Any:
+        """Enter or not the given context, call task with args and kwargs"""
+        start = time.perf_counter()
+        with (self.lock or contextlib.nullcontext()):
+            with (self.context or contextlib.nullcontext()):
+                self.output = self.task(*self.args, **kwargs)
+        if self.stats:
+            self.stats.took(time.perf_counter() - start)
+        return self.output
+
+    def __dispatch__(self, kwargs: Dict[str, Any]) -> None:
+        """Submit a call to the executor, or apply the overlap policy if one is still running"""
+        with self._guard:
+            if self._busy:
+                if (self.overlap == BrokenTaskOverlap.Skip):
+                    if self.stats:
+                        self.stats.skipped += 1
+                    return
+                if (self.overlap == BrokenTaskOverlap.Coalesce):
+                    self._backlog.clear()
+                self._backlog.append(kwargs)
+                return
+            self._busy = True
+
+        if (self.executor == BrokenTaskExecutor.Thread):
+            if self._worker is None:
+                self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"BrokenTask-{id(self)}")
+            self._worker.submit(self.__drain__, kwargs)
+        else:
+            self.pool().submit(self.__drain__, kwargs)
+
+    def shutdown(self) -> None:
+        """Release the dedicated thread once any running and waiting calls finish"""
+        with self._guard:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.shutdown(wait=False)
+
+    def __drain__(self, kwargs: Dict[str, Any]) -> None:
+        """Run a call and then any waiting ones, on the executor's thread"""
+        while True:
+            try:
+                self.__call__(kwargs)
+            except Exception:
+                log.exception(f"BrokenTask {self.task} raised on its {self.executor.value} executor")
+            with self._guard:
+                if not self._backlog:
+                    self._busy = False
+                    return
+                kwargs = self._backlog.popleft()
+
 @define
 class BrokenScheduler:
     clients: List[BrokenTask] = Factory(list)
 
+    # Priority heap of (next_call, sequence, task), entries are lazily invalidated: only the one
+    # with the task's latest sequence number is valid, stale ones are dropped when reaching the top
+    _heap:     List[Tuple[Seconds, int, BrokenTask]] = Factory(list)
+    _sequence: Dict[int, int] = Factory(dict)
+    _counter:  Any = Factory(itertools.count)
+    _once:     Deque[BrokenTask] = Factory(deque)
+    _dead:     int = 0
+
+    # Run loop state, sleepers are woken up early by any new or rescheduled task
+    _condition: Condition = Factory(Condition)
+    _running:   bool = False
+    _loop:      asyncio.AbstractEventLoop = None
+    _wakeup:    asyncio.Event = None
+
+    MARGIN: ClassVar[Seconds] = 0.002
+    """Precise tasks are waited on until this close to their deadline, then precise_sleep'd"""
+
     def add_task(self, client: BrokenTask) -> BrokenTask:
         """Adds a client to the manager with immediate next call"""
+        client._scheduler = self
         self.clients.append(client)
+        if client.once:
+            self._once.append(client)
+        self.__push__(client)
         return client
 
+    def remove_task(self, client: BrokenTask) -> None:
+        """Stops scheduling a client, it is removed from the clients list on the next compaction"""
+        self._sequence.pop(id(client), None)
+        client._scheduler = None
+        client.enabled = False
+        client.once = True
+        client.shutdown()
+        self._dead += 1
+
     def new(self, task: Callable, *a, **k) -> BrokenTask:
         """Wraps around BrokenVsync for convenience"""
         return self.add_task(BrokenTask(task=task, *a, **k))
@@ -168,6 +372,30 @@ class BrokenScheduler:
         """Wraps around BrokenVsync for convenience"""
         return self.once(task=functools.partial(task=task, *a, **k))
 
+    # # Heap
+
+    def __push__(self, client: BrokenTask) -> None:
+        """(Re)schedule a client on its next_call, invalidating any previous heap entry"""
+        with self._condition:
+            if not client.enabled:
+                if self._sequence.pop(id(client), None) is not None and client.once:
+                    self._dead += 1
+                return
+            sequence = next(self._counter)
+            self._sequence[id(client)] = sequence
+            heapq.heappush(self._heap, (client.next_call, sequence, client))
+
+            # Wake up sleepers only if the earliest deadline changed
+            if (self._heap[0][1] == sequence):
+                self.__wakeup__()
+
+    def __wakeup__(self) -> None:
+        """Wake up the blocking and asyncio run loops, safe to call from any thread"""
+        with self._condition:
+            self._condition.notify_all()
+        if (self._loop is not None) and (self._wakeup is not None):
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
     # # Filtering
 
     @property
@@ -179,15 +407,31 @@ class BrokenScheduler:
 
     @property
     def next_task(self) -> BrokenTask | None:
-        """Returns the next client to be called"""
-        return min(self.enabled_tasks)
+        """Returns the next client to be called, None if there are no enabled clients"""
+        with self._condition:
+            while self._heap:
+                _, sequence, client = self._heap[0]
+                if self._sequence.get(id(client)) == sequence:
+                    return client
+                heapq.heappop(self._heap)
+            return None
+
+    def __delay__(self, client: BrokenTask) -> Seconds:
+        """Seconds the run loops should sleep before handing the client to its own .next()"""
+        if client.decoupled:
+            return 0
+        delay = (client.next_call - time.bang_counter())
+        return (delay - self.MARGIN) if client.precise else delay
 
     def _sanitize(self) -> None:
-        """Removes disabled 'once' clients"""
-        length = len(self.clients)
-        for i, client in enumerate(reversed(self.clients)):
-            if client.should_delete:
-                del self.clients[length - i - 1]
+        """Removes disabled 'once' clients, compacting only when most of the list is dead"""
+        if self._dead <= len(self.clients)//2:
+            return
+        self.clients = [client for client in self.clients if not client.should_delete]
+        self._once   = deque(client for client in self._once if client.enabled)
+        self._heap   = [entry for entry in self._heap if self._sequence.get(id(entry[2])) == entry[1]]
+        heapq.heapify(self._heap)
+        self._dead   = 0
 
     # # Actions
 
@@ -200,30 +444,97 @@ class BrokenScheduler:
 
     def all_once(self) -> None:
         """Calls all 'once' clients. Useful for @partial calls on the main thread"""
-        for client in self.clients:
-            if client.once:
+        while self._once:
+            if (client := self._once.popleft()).enabled:
                 client.next()
         self._sanitize()
 
-    # # Block-free next
+    # # Statistics
 
-    __work__: bool = False
-
-    def smart_next(self) -> None | Any:
-        # Note: Proof of concept. The frametime Ticking might be enough for ShaderFlow
-
-        # Too close to the next known call, call blocking
-        if abs(time.bang_counter() - self.next_task.next_call) < 0.005:
-            return self.next(block=True)
+    def report(self, *, echo: bool=True) -> Dict[str, Dict[str, Any]]:
+        """Timing statistics of all instrumented tasks, by unique 'name (id)', optionally logged"""
+        report = dict()
+        for client in self.clients:
+            if not client.stats:
+                continue
+            name = f"{getattr(client.task, '__qualname__', repr(client.task))} ({id(client):#x})"
+            summary = report[name] = client.stats.summary()
+            log.info((
+                f"{name}: {summary['calls']} calls, {summary['missed']} missed, {summary['skipped']} skipped"
+                f" | Late (ms) p50 {summary['lateness']['p50']*1000:.3f} p95 {summary['lateness']['p95']*1000:.3f}"
+                f" p99 {summary['lateness']['p99']*1000:.3f}"
+                f" | Took (ms) p50 {summary['duration']['p50']*1000:.3f} p95 {summary['duration']['p95']*1000:.3f}"
+                f" p99 {summary['duration']['p99']*1000:.3f}"
+            ), echo=echo)
+        return report
+
+    # # Run loops
+
+    def wait(self, timeout: Seconds=None) -> Optional[BrokenTask]:
+        """
+        Sleep until the earliest deadline, woken up early whenever a task is added or rescheduled
+
+        Args:
+            `timeout`: Give up after this many seconds without any due task, None for forever
+
+        Returns:
+            The due task to be called, None on timeout or stop
+        """
+        until = (time.bang_counter() + timeout) if (timeout is not None) else None
+        with self._condition:
+            while True:
+                left = (until - time.bang_counter()) if (until is not None) else None
+                if (left is not None) and (left <= 0):
+                    return None
+                if (client := self.next_task) is None:
+                    self._condition.wait(left)
+                    continue
+                if (delay := self.__delay__(client)) <= 0:
+                    return client
+                self._condition.wait(delay if (left is None) else min(delay, left))
+
+    def run(self, stop: Event=None) -> None:
+        """
+        Blocking loop calling tasks exactly on their deadlines, sleeping in between
+
+        Args:
+            `stop`: Optional event to stop the loop, also stops with `.stop()`
+        """
+        self._running = True
+        while self._running and not (stop and stop.is_set()):
+            if (client := self.wait(timeout=0.1)):
+                client.next(block=True)
+            self._sanitize()
 
-        # By chance any "recently added" client was added
-        if (call := self.next(block=False)):
-            self.__work__ = True
-            return call
+    async def arun(self) -> None:
+        """Same as .run(), as an asyncio task, other coroutines run while waiting for deadlines"""
+        self._loop    = asyncio.get_running_loop()
+        self._wakeup  = asyncio.Event()
+        self._running = True
+        try:
+            while self._running:
+                self._wakeup.clear()
+                client = self.next_task
+                delay  = self.__delay__(client) if client else None
+                if (delay is None) or (delay > 0):
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self._wakeup.wait(), delay)
+                    continue
+                client.next(block=True)
+                self._sanitize()
+                await asyncio.sleep(0)
+        finally:
+            self._loop = self._wakeup = None
 
-        # Next iteration, wait for work but don't spin lock
-        if not self.__work__:
-            time.sleep(0.001)
+    def stop(self) -> None:
+        """Stop any blocking or asyncio run loop, safe to call from any thread"""
+        self._running = False
+        self.__wakeup__()
 
-        # Flag that there was not work done
-        self.__work__ = False
+    def smart_next(self) -> None | Any:
+        """Sleep until the next deadline (or a new earlier task), then call it"""
+        try:
+            if (client := self.wait()):
+                return client.next(block=True)
+        finally:
+            self._sanitize()
@@ -1,3 +1,4 @@
+import ctypes
 import enum
 import hashlib
 import inspect
@@ -5,6 +6,7 @@ import os
 import shutil
 import subprocess
 import sys
+import threading
 import time
 import types
 import uuid
@@ -23,6 +25,97 @@ import click
 from loguru import logger as log
 
 
+class BrokenPreciseSleep:
+    """
+    Precise sleep engine, sleeps in the OS until a calibrated margin before the deadline, then spins
+    • Linux: clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME) on absolute deadlines, immune to
+      drift of relative sleeps, with a 1µs timer slack (prctl) on the sleeping threads
+    • Others: time.sleep(), high resolution timers on Python 3.11+ Windows
+    • The margin tracks the oversleep distribution (mean + 4 deviations), first measured on a
+      short calibration on the first use, then adapted on every sleep
+    """
+    MIN_MARGIN: float = 20e-6
+    MAX_MARGIN: float = 2e-3
+
+    class timespec(ctypes.Structure):
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+    def __init__(self):
+        self.mean       = 0.0
+        self.deviation  = 0.0
+        self.calibrated = False
+        self.threads    = threading.local()
+        self.libc       = None
+
+        if sys.platform.startswith("linux"):
+            try:
+                self.libc = ctypes.CDLL(None, use_errno=True)
+                self.libc.clock_nanosleep.argtypes = (ctypes.c_int, ctypes.c_int,
+                    ctypes.POINTER(self.timespec), ctypes.c_void_p)
+            except (OSError, AttributeError):
+                self.libc = None
+
+    @property
+    def margin(self) -> float:
+        """Time before the deadline to stop sleeping and start spinning"""
+        return min(max(self.mean + 4*self.deviation, self.MIN_MARGIN), self.MAX_MARGIN)
+
+    def __observe__(self, oversleep: float, alpha: float=0.05) -> None:
+        """Update the oversleep mean and mean absolute deviation estimates"""
+        error = (oversleep - self.mean)
+        self.mean      += alpha*error
+        self.deviation += alpha*(abs(error) - self.deviation)
+
+    def calibrate(self, samples: int=32, duration: float=1e-3) -> None:
+        """Measure this host's oversleep distribution with a few short sleeps"""
+        oversleeps = []
+        for _ in range(samples):
+            target = time.perf_counter() + duration
+            self.coarse(target)
+            oversleeps.append(max(0, time.perf_counter() - target))
+        self.mean = sum(oversleeps)/samples
+        self.deviation = sum(abs(oversleep - self.mean) for oversleep in oversleeps)/samples
+        self.calibrated = True
+
+    def coarse(self, deadline: float) -> None:
+        """Sleep in the OS until about a time.perf_counter() deadline, without spinning"""
+        if self.libc is None:
+            time.sleep(max(0, deadline - time.perf_counter()))
+            return
+
+        # Lower the timer slack (default 50µs) of each thread using us once
+        if not getattr(self.threads, "slack", False):
+            self.libc.prctl(29, ctypes.c_ulong(1000), 0, 0, 0) # PR_SET_TIMERSLACK
+            self.threads.slack = True
+
+        # Translate the deadline to the monotonic clock, sleep to it, retry on signal interrupts
+        target = time.clock_gettime(time.CLOCK_MONOTONIC) + (deadline - time.perf_counter())
+        if target <= 0:
+            return
+        spec = self.timespec(int(target), int((target % 1) * 1e9))
+        while self.libc.clock_nanosleep(time.CLOCK_MONOTONIC, 1, ctypes.byref(spec), None) == 4: # EINTR
+            pass
+
+    def until(self, deadline: float) -> None:
+        """Sleep precisely until a time.perf_counter() deadline"""
+        if not self.calibrated:
+            self.calibrate()
+
+        # Sleep close to the due time, learning from how much we overslept
+        if (ahead := deadline - self.margin) > time.perf_counter():
+            self.coarse(ahead)
+            self.__observe__(max(0, time.perf_counter() - ahead))
+
+        # Spin the thread for the remaining margin (precise Sleep)
+        while time.perf_counter() < deadline:
+            pass
+
+    def __call__(self, seconds: float) -> None:
+        if seconds > 0:
+            self.until(time.perf_counter() + seconds)
+
+PRECISE_SLEEP = BrokenPreciseSleep()
+
 def precise_sleep(seconds: float) -> None:
     """
     Sleep for a precise amount of time. This function is very interesting for some reasons:
@@ -40,9 +133,9 @@ def precise_sleep(seconds: float) -> None:
     As evident, this spins the thread full time due the .perf_counter() and conditional, which
     is not wanted on a sleep function (to use 100% of a thread)
 
-    Taking advantage of the fact that time.sleep() is usually precise enough, and always will
-    overshoot the time, we can sleep close to the time and apply the previous spinning method
-    to achieve a very precise sleep, with a low enough overhead, relatively speaking.
+    Taking advantage of the fact that OS sleeps always overshoot the time by a host-dependent
+    amount, BrokenPreciseSleep measures it and sleeps up to that close to the time, applying the
+    previous spinning method only on the last few tens of microseconds.
 
     Args:
         seconds: Precise time to sleep
@@ -50,17 +143,7 @@ def precise_sleep(seconds: float) -> None:
     Returns:
         None
     """
-    if seconds < 0:
-        return
-
-    # Sleep close to the due time
-    start = time.perf_counter()
-    ahead = max(0, seconds - 1e-3)
-    time.sleep(max(0, ahead))
-
-    # Spin the thread until the time is up (precise Sleep)
-    while (time.perf_counter() - start) < seconds:
-        pass
+    PRECISE_SLEEP(seconds)
 
 # Count time since.. the big bang with the bang counter. Shebang #!
 # Serious note, a Decoupled client starts at the Python's time origin, others on OS perf counter
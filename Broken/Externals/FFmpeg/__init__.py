@@ -2,19 +2,33 @@
 
 from __future__ import annotations
 
+import asyncio
+import contextlib
 import functools
+import hashlib
 import inspect
 import io
+import itertools
+import json
+import os
 import re
 import subprocess
+import tempfile
 import time
-from collections import deque
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
 from pathlib import Path
 from subprocess import DEVNULL, PIPE, Popen
-from threading import Thread
+from threading import Condition, Thread
+from fractions import Fraction
 from typing import (
     Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
     Deque,
+    Dict,
     Generator,
     Iterable,
     List,
@@ -26,15 +40,16 @@ from typing import (
 )
 
 import numpy
-import PIL
 from attr import Factory, define, field
 from dotmap import DotMap
 from loguru import logger as log
 
+import Broken
 from Broken import (
     BrokenEnum,
     BrokenPath,
     BrokenPlatform,
+    BrokenRelay,
     BrokenSpinner,
     BrokenThread,
     apply,
@@ -43,7 +58,7 @@ from Broken import (
     nearest,
     shell,
 )
-from Broken.Types import Hertz, Range, Seconds
+from Broken.Types import Hertz, Range, Samples, Seconds
 
 # ----------------------------------------------|
 # Resolution
@@ -416,11 +431,58 @@ class FFmpegH265_NVENC__Tier(BrokenEnum):
 class FFmpegPixelFormat(BrokenEnum):
     """-pix_fmt ffmpeg option"""
     RGB24   = "rgb24"
+    BGR24   = "bgr24"
     RGBA    = "rgba"
+    RGB48   = "rgb48le"
+    RGBA64  = "rgba64le"
+    GRAY    = "gray"
+    GRAY16  = "gray16le"
     YUV420P = "yuv420p"
     YUV422P = "yuv422p"
     YUV444P = "yuv444p"
 
+    @property
+    def dtype(self) -> numpy.dtype:
+        """Numpy dtype of a raw frame's component"""
+        return numpy.dtype("<u2" if self.value.endswith("le") else "u1")
+
+    def shape(self, width: int, height: int) -> Tuple[int, ...]:
+        """
+        Numpy shape of a raw frame on this pixel format
+        • Packed formats are (height, width, components) or (height, width) for gray
+        • Planar YUV are the planes stacked on the first axis, (3, h, w) for 4:4:4 and the
+          usual I420-like (h*3/2, w) and (h*2, w) layouts for 4:2:0 and 4:2:2
+        """
+        return {
+            FFmpegPixelFormat.RGB24:   (height, width, 3),
+            FFmpegPixelFormat.BGR24:   (height, width, 3),
+            FFmpegPixelFormat.RGBA:    (height, width, 4),
+            FFmpegPixelFormat.RGB48:   (height, width, 3),
+            FFmpegPixelFormat.RGBA64:  (height, width, 4),
+            FFmpegPixelFormat.GRAY:    (height, width),
+            FFmpegPixelFormat.GRAY16:  (height, width),
+            FFmpegPixelFormat.YUV420P: (height*3//2, width),
+            FFmpegPixelFormat.YUV422P: (height*2, width),
+            FFmpegPixelFormat.YUV444P: (3, height, width),
+        }[self]
+
+    def size(self, width: int, height: int) -> int:
+        """Bytes of a raw frame on this pixel format"""
+        return int(numpy.prod(self.shape(width, height))) * self.dtype.itemsize
+
+    def empty(self, width: int, height: int) -> numpy.ndarray:
+        """A new uninitialized raw frame array on this pixel format"""
+        return numpy.empty(self.shape(width, height), dtype=self.dtype)
+
+def _readinto(stream: io.BufferedReader, frame: numpy.ndarray) -> bool:
+    """Fill a contiguous array from a pipe without intermediate bytes, False on end of stream"""
+    view = memoryview(frame).cast("B")
+    while view:
+        if not (read := stream.readinto(view)):
+            return False
+        view = view[read:]
+    return True
+
 class FFmpegFormat(BrokenEnum):
     """-f ffmpeg option"""
     Rawvideo   = "rawvideo"
@@ -517,6 +579,253 @@ class FFmpegHWAccel(BrokenEnum):
     VDPAU = "vdpau"
     VAAPI = "vaapi"
 
+# ----------------------------------------------|
+# Probing
+
+def _fraction(value: Optional[str]) -> Optional[float]:
+    """Parse ffprobe's rational strings like '30000/1001', where '0/0' means unknown"""
+    try:
+        return float(Fraction(value)) or None
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+def _number(value: Any, type: type=float) -> Optional[Any]:
+    """Parse ffprobe's numbers as strings, where 'N/A' or missing means unknown"""
+    try:
+        return type(value)
+    except (TypeError, ValueError):
+        return None
+
+@define
+class FFmpegStream:
+    """A single stream of a media file, as reported by ffprobe"""
+    index:      int
+    type:       Literal["video", "audio", "subtitle", "data", "attachment"]
+    codec:      Optional[str]     = None
+    width:      Optional[int]     = None
+    height:     Optional[int]     = None
+    pixel_fmt:  Optional[str]     = None
+    framerate:  Optional[Hertz]   = None
+    avg_rate:   Optional[Hertz]   = None
+    samplerate: Optional[Hertz]   = None
+    channels:   Optional[int]     = None
+    duration:   Optional[Seconds] = None
+    frames:     Optional[int]     = None
+    bitrate:    Optional[int]     = None
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> FFmpegStream:
+        return FFmpegStream(
+            index=int(data["index"]),
+            type=data.get("codec_type", "data"),
+            codec=data.get("codec_name"),
+            width=_number(data.get("width"), int),
+            height=_number(data.get("height"), int),
+            pixel_fmt=data.get("pix_fmt"),
+            framerate=_fraction(data.get("r_frame_rate")),
+            avg_rate=_fraction(data.get("avg_frame_rate")),
+            samplerate=_number(data.get("sample_rate"), int),
+            channels=_number(data.get("channels"), int),
+            duration=_number(data.get("duration")),
+            frames=_number(data.get("nb_frames"), int),
+            bitrate=_number(data.get("bit_rate"), int),
+        )
+
+@define
+class FFmpegProbe:
+    """Container and streams metadata of a media file, see BrokenFFmpeg.probe"""
+    path:     Path
+    format:   Optional[str]      = None
+    duration: Optional[Seconds]  = None
+    size:     Optional[int]      = None
+    bitrate:  Optional[int]      = None
+    streams:  Tuple[FFmpegStream, ...] = ()
+
+    @staticmethod
+    def from_json(path: Path, data: Dict[str, Any]) -> FFmpegProbe:
+        format = data.get("format", {})
+        return FFmpegProbe(
+            path=path,
+            format=format.get("format_name"),
+            duration=_number(format.get("duration")),
+            size=_number(format.get("size"), int),
+            bitrate=_number(format.get("bit_rate"), int),
+            streams=tuple(map(FFmpegStream.from_json, data.get("streams", []))),
+        )
+
+    @property
+    def video_streams(self) -> Tuple[FFmpegStream, ...]:
+        return tuple(stream for stream in self.streams if stream.type == "video")
+
+    @property
+    def audio_streams(self) -> Tuple[FFmpegStream, ...]:
+        return tuple(stream for stream in self.streams if stream.type == "audio")
+
+    @property
+    def video(self) -> Optional[FFmpegStream]:
+        """The first video stream, if any"""
+        return next(iter(self.video_streams), None)
+
+    @property
+    def audio(self) -> Optional[FFmpegStream]:
+        """The first audio stream, if any"""
+        return next(iter(self.audio_streams), None)
+
+class FFmpegFrameCountMethod(BrokenEnum):
+    """How a video's total frames were counted, cheapest first"""
+    Metadata = "metadata"
+    Packets  = "packets"
+    Decode   = "decode"
+
+@define
+class FFmpegFrameCount:
+    frames: int
+    method: FFmpegFrameCountMethod = field(converter=FFmpegFrameCountMethod.get)
+
+@define
+class FFmpegProgress:
+    """A progress report of a running FFmpeg job, parsed from `-progress` key=value blocks"""
+    frame:       int     = 0
+    fps:         Hertz   = 0
+    bitrate:     float   = 0
+    """Output bitrate in kbit/s"""
+    total_size:  int     = 0
+    out_time:    Seconds = 0
+    speed:       float   = 0
+    """Encoding speed as a multiple of realtime"""
+    dup_frames:  int     = 0
+    drop_frames: int     = 0
+    ended:       bool    = False
+
+    @staticmethod
+    def from_block(block: Dict[str, str]) -> FFmpegProgress:
+        """Parse a block of `key=value` lines terminated by a `progress=` line"""
+        return FFmpegProgress(
+            frame=_number(block.get("frame"), int) or 0,
+            fps=_number(block.get("fps")) or 0,
+            bitrate=_number(block.get("bitrate", "").removesuffix("kbits/s")) or 0,
+            total_size=_number(block.get("total_size"), int) or 0,
+            out_time=(_number(block.get("out_time_us"), int) or 0)/1e6,
+            speed=_number(block.get("speed", "").removesuffix("x")) or 0,
+            dup_frames=_number(block.get("dup_frames"), int) or 0,
+            drop_frames=_number(block.get("drop_frames"), int) or 0,
+            ended=(block.get("progress") == "end"),
+        )
+
+    def __str__(self) -> str:
+        return ' '.join((
+            f"frame {self.frame} ({self.fps:.1f} fps, {self.speed:.2f}x),",
+            f"time {self.out_time:.2f}s, {self.bitrate:.0f} kbit/s,",
+            f"dup {self.dup_frames} drop {self.drop_frames}",
+        ))
+
+@define
+class FFmpegPipeStats:
+    """Throughput and stall counters of a BrokenFFmpeg pipe writer"""
+
+    frames: int = 0
+    """Total frames handed to FFmpeg's stdin"""
+
+    bytes: int = 0
+    """Total bytes handed to FFmpeg's stdin"""
+
+    started: Seconds = Factory(time.perf_counter)
+    """Instant the writer was created, on perf_counter() time"""
+
+    stalled: Seconds = 0
+    """Time the producer (renderer) spent blocked on a full ring, the encoder is behind"""
+
+    starved: Seconds = 0
+    """Time the consumer (encoder) spent waiting on an empty ring, the renderer is behind"""
+
+    @property
+    def elapsed(self) -> Seconds:
+        return max(time.perf_counter() - self.started, 1e-9)
+
+    @property
+    def fps(self) -> Hertz:
+        return self.frames/self.elapsed
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second written to FFmpeg"""
+        return self.bytes/self.elapsed
+
+    @property
+    def bottleneck(self) -> Literal["encoder", "renderer"]:
+        return ("encoder" if (self.stalled > self.starved) else "renderer")
+
+    def __str__(self) -> str:
+        return ' '.join((
+            f"{self.frames} frames in {self.elapsed:.2f}s ({self.fps:.2f} fps, {self.throughput/2**20:.1f} MiB/s),",
+            f"stalled {self.stalled:.2f}s, starved {self.starved:.2f}s, bottleneck is the {self.bottleneck}",
+        ))
+
+@define
+class BrokenFFmpegProgress:
+    """
+    Live progress of a BrokenFFmpeg job, attached with `BrokenFFmpeg.progress()`
+    • FFmpeg writes `-progress` reports to a pipe, parsed on a background thread
+    • The latest report is at `.report`, callbacks are called with every new one
+    """
+    callbacks: BrokenRelay = Factory(BrokenRelay)
+    report:    FFmpegProgress = Factory(FFmpegProgress)
+
+    stall: Seconds = 10
+    """Seconds without new frames for the job to be considered stalled"""
+
+    _block:   Dict[str, str] = Factory(dict)
+    _updated: Seconds        = Factory(time.perf_counter)
+    _thread:  Thread         = None
+
+    @property
+    def since(self) -> Seconds:
+        """Seconds since the frame counter last advanced"""
+        return (time.perf_counter() - self._updated)
+
+    @property
+    def stalled(self) -> bool:
+        return (not self.report.ended) and (self.since > self.stall)
+
+    def feed(self, line: str) -> Optional[FFmpegProgress]:
+        """Parse a line of a `-progress` report, returns a new report when a block completes"""
+        key, _, value = line.strip().partition("=")
+        self._block[key] = value
+        if (key != "progress"):
+            return None
+        report, self._block = FFmpegProgress.from_block(self._block), {}
+        if (report.frame != self.report.frame) or report.ended:
+            self._updated = time.perf_counter()
+        self.report = report
+        self.callbacks(report)
+        return report
+
+    @contextlib.contextmanager
+    def __attach__(self, command: List[str], kwargs: Dict[str, Any]) -> Generator[List[str], None, None]:
+        """Yields the command reporting to a new pipe, whose write end is closed on exit"""
+        if BrokenPlatform.OnWindows:
+            log.warning("BrokenFFmpeg progress reports need inheritable pipes, unsupported on Windows")
+            yield command
+            return
+
+        read, write = os.pipe()
+        kwargs["pass_fds"] = (*kwargs.get("pass_fds", ()), write)
+        self._thread = BrokenThread.new(self.__worker__, read, daemon=True)
+        try:
+            yield BrokenFFmpeg.__with_progress__(command, f"pipe:{write}")
+        finally:
+            os.close(write)
+
+    def __worker__(self, fd: int) -> None:
+        with open(fd, "r") as reports:
+            for line in reports:
+                self.feed(line)
+
+    def join(self) -> None:
+        """Wait for the last report after FFmpeg exits"""
+        if (self._thread is not None):
+            self._thread.join()
+
 # -------------------------------------------------------------------------------------------------|
 
 @define
@@ -563,6 +872,7 @@ class BrokenFFmpeg:
     filters:     List[str] = Factory(list)
     __command__: List[str] = Factory(list)
     binary:      Path      = None
+    __progress__: BrokenFFmpegProgress = None
 
     def __private_to_option__(self, string: str) -> str:
         """Option commands are the string between the first two dunder"""
@@ -597,10 +907,13 @@ class BrokenFFmpeg:
             self.no_audio,
             self.advanced,
             self.audio_codec,
+            self.progress,
         )
 
     @staticmethod
+    @functools.lru_cache
     def install() -> None:
+        """Download FFmpeg if it isn't on the System Path or Externals, checked once per process"""
         if all(map(BrokenPath.which, ("ffmpeg", "ffprobe"))):
             return
 
@@ -618,6 +931,23 @@ class BrokenFFmpeg:
             for binary in ("ffmpeg", "ffprobe"):
                 BrokenPath.get_external(f"https://evermeet.cx/ffmpeg/getrelease/{binary}/zip")
 
+    @staticmethod
+    @functools.lru_cache
+    def which(name: Literal["ffmpeg", "ffprobe"]="ffmpeg") -> Optional[Path]:
+        """Resolve a FFmpeg binary once per process, walking the Externals only on the first call"""
+        BrokenFFmpeg.install()
+        if (binary := BrokenPath.which(name)):
+            log.debug(f"Using {name} binary at ({binary})")
+            return binary
+
+        # Last resort, ImageIO ships a FFmpeg binary, but no FFprobe
+        if (name == "ffmpeg") and (binary := Path(__import__("imageio_ffmpeg").get_ffmpeg_exe())):
+            log.debug(f"Using ImageIO FFmpeg binary at ({binary})")
+            return binary
+
+        log.error(f"Could not find ({name}) binary on System Path or Externals")
+        return None
+
     def set_ffmpeg_binary(self, binary: Path=None) -> Self:
         """Set the ffmpeg binary to use, by default it is 'ffmpeg'"""
         if binary:
@@ -625,21 +955,7 @@ class BrokenFFmpeg:
             self.binary = binary
             return self
 
-        BrokenFFmpeg.install()
-
-        # Try finding with shutil
-        if (binary := BrokenPath.which("ffmpeg")):
-            log.debug(f"Using FFmpeg binary at ({binary})")
-            self.binary = binary
-            return self
-
-        import imageio_ffmpeg
-
-        binary = Path(imageio_ffmpeg.get_ffmpeg_exe())
-        log.debug(f"Using ImageIO FFmpeg binary at ({binary})")
-
-        if not binary:
-            log.error("Could not find (FFmpeg) binary on System Path or Externals, and don't have (ImageIO FFmpeg) package")
+        if not (binary := BrokenFFmpeg.which("ffmpeg")):
             exit(1)
 
         self.binary = binary
@@ -684,7 +1000,7 @@ class BrokenFFmpeg:
     ) -> Self:
         """Append items to the command, maybe delete or add new callbacks to the options"""
         log.debug(f"BrokenFFmpeg Append: {items}")
-        self.__command__ = flatten(self.__command__, items)
+        self.__command__.extend(flatten(items))
         self.__del_option__(delete)
         self.__add_option__(add)
         return self
@@ -757,6 +1073,19 @@ class BrokenFFmpeg:
     def hide_banner(self) -> Self:
         return self.__smart__("-hide_banner", delete=self.hide_banner)
 
+    def progress(self, *callbacks: Callable[[FFmpegProgress], None], stall: Seconds=10) -> Self:
+        """
+        Track the job's live progress, see BrokenFFmpegProgress
+        • Access it at `.tracker` or receive every FFmpegProgress report on callbacks
+        """
+        self.__progress__ = BrokenFFmpegProgress(stall=stall)
+        self.__progress__.callbacks.bind(*callbacks)
+        return self
+
+    @property
+    def tracker(self) -> Optional[BrokenFFmpegProgress]:
+        return self.__progress__
+
     # ---------------------------------------------------------------------------------------------|
     # Bitrate
 
@@ -807,8 +1136,8 @@ class BrokenFFmpeg:
     def input(self, path: str) -> Self:
         """Input some audio file, video file, or pipe '-' from stdin"""
 
-        # Allow pipe from stdin
-        if path == "-":
+        # Allow pipe from stdin or template placeholders
+        if (path == "-") or BrokenFFmpegTemplate.placeholder(path):
             pass
 
         elif not (path := BrokenPath(path)).exists():
@@ -1016,14 +1345,53 @@ class BrokenFFmpeg:
     def command(self) -> List[str]:
         return apply(denum, flatten(self.binary, self.__command__))
 
+    def compile(self) -> BrokenFFmpegTemplate:
+        """
+        Freeze the built command into a template whose `{name}` placeholders are filled later
+
+        ```python
+        template = (BrokenFFmpeg()
+            .custom("-ss", "{time}")
+            .input("{input}")
+            .custom("-frames:v", 1)
+            .output("{output}")
+        ).compile()
+
+        for index, time in enumerate(times):
+            template.run(dict(input=video, time=time, output=f"{index}.png"))
+        ```
+        """
+        return BrokenFFmpegTemplate.from_command(self.command)
+
+    @contextlib.contextmanager
+    def __spawn__(self, kwargs: Dict[str, Any]) -> Generator[List[str], None, None]:
+        """Yields the command to spawn, attaching the progress tracker if any"""
+        if (self.__progress__ is None):
+            yield self.command
+            return
+        with self.__progress__.__attach__(self.command, kwargs) as command:
+            yield command
+
     def run(self, **kwargs) -> subprocess.CompletedProcess:
-        return shell(self.command, **kwargs)
+        with self.__spawn__(kwargs) as command:
+            result = shell(command, **kwargs)
+        if (self.__progress__ is not None):
+            self.__progress__.join()
+        return result
 
     def Popen(self, **kwargs) -> subprocess.Popen:
-        return shell(self.command, Popen=True, **kwargs)
+        with self.__spawn__(kwargs) as command:
+            return shell(command, Popen=True, **kwargs)
 
-    def pipe(self, *args, **kwargs) -> object:
-        """Spawns a Popen process of BrokenFFmpeg that is buffered, use .write(data: bytes) and .close()"""
+    def pipe(self, *args, ring: bool=True, **kwargs) -> object:
+        """
+        Spawns a Popen process of BrokenFFmpeg that is buffered, use .write(data: bytes) and .close()
+
+        Args:
+            `ring`: Use the preallocated BrokenFFmpegRingWriter, else the legacy deque writer
+        """
+        if ring:
+            return BrokenFFmpegRingWriter(ffmpeg=self, *args, **kwargs)
 
         @define
         class BrokenFFmpegPopenBuffered:
@@ -1071,60 +1439,451 @@ class BrokenFFmpeg:
 
         return BrokenFFmpegPopenBuffered(ffmpeg=self, *args, **kwargs)
 
+    # ---------------------------------------------------------------------------------------------|
+    # Asynchronous
+
+    @staticmethod
+    def __with_progress__(command: List[str], url: str) -> List[str]:
+        """Insert global options for machine readable progress reports to some url"""
+        return [command[0], "-progress", url, "-nostats", *command[1:]]
+
+    async def apopen(self, *, echo: bool=True, **kwargs) -> asyncio.subprocess.Process:
+        """Spawn the command as an asyncio subprocess, kwargs are sent to create_subprocess_exec"""
+        return await BrokenFFmpeg.__aspawn__(self.command, echo=echo, **kwargs)
+
+    @staticmethod
+    async def __aspawn__(command: List[Any], *, echo: bool=True, **kwargs) -> asyncio.subprocess.Process:
+        command = tuple(map(str, flatten(command)))
+        log.info(f"Running Command {command} (async)", echo=echo)
+        return await asyncio.create_subprocess_exec(*command, **kwargs)
+
+    async def aprogress(self, *, echo: bool=True, **kwargs) -> AsyncGenerator[FFmpegProgress, None]:
+        """
+        Run the command yielding progress reports from `-progress pipe:1` as they come
+        • The output must not be stdout, as it carries the reports
+        • Breaking out early kills the process, as nothing would drain its progress pipe
+        """
+        process = await self.__aprogress_spawn__(echo=echo, **kwargs)
+        async for report in self.__areports__(process):
+            yield report
+
+    async def __aprogress_spawn__(self, *, echo: bool=True, **kwargs) -> asyncio.subprocess.Process:
+        return await BrokenFFmpeg.__aspawn__(
+            BrokenFFmpeg.__with_progress__(self.command, "pipe:1"),
+            stdout=PIPE, echo=echo, **kwargs)
+
+    async def __areports__(self, process: asyncio.subprocess.Process) -> AsyncGenerator[FFmpegProgress, None]:
+        """Yield a process' progress reports until it exits, killing it if abandoned early"""
+        tracker  = (self.__progress__ or BrokenFFmpegProgress())
+        finished = False
+        try:
+            while (line := await process.stdout.readline()):
+                if (report := tracker.feed(line.decode())):
+                    yield report
+            finished = True
+        finally:
+            if (not finished) and (process.returncode is None):
+                with contextlib.suppress(ProcessLookupError):
+                    process.kill()
+            await process.wait()
+
+    async def arun(self,
+        progress: Callable[[FFmpegProgress], Union[None, Awaitable]]=None,
+        *,
+        echo: bool=True,
+        **kwargs
+    ) -> int:
+        """
+        Run the command without blocking the event loop, returns the exit code
+
+        Args:
+            `progress`: Optional (async) callback receiving FFmpegProgress reports
+        """
+        if progress is None:
+            process = await self.apopen(echo=echo, **kwargs)
+            return await process.wait()
+
+        process = await self.__aprogress_spawn__(echo=echo, **kwargs)
+        async for report in self.__areports__(process):
+            if inspect.isawaitable(result := progress(report)):
+                await result
+        return process.returncode
+
+    def apipe(self, *, echo: bool=True) -> BrokenFFmpegAsyncWriter:
+        """An async writer to the command's stdin, `await .write(frame)` and `await .close()`"""
+        return BrokenFFmpegAsyncWriter(ffmpeg=self, echo=echo)
+
+    @staticmethod
+    async def aprobe(path: Path, *, echo: bool=True) -> Optional[FFmpegProbe]:
+        """Async BrokenFFmpeg.probe, sharing the same on-disk cache"""
+        if not (path := BrokenPath(path).valid()):
+            return None
+        identity = BrokenFFmpeg.__identity__(path)
+        key = ("probe", *identity)
+
+        if (data := BrokenFFmpeg.cache().get(key)) is None:
+            BrokenFFmpeg.install()
+            log.minor(f"Probing media file ({path})", echo=echo)
+            process = await BrokenFFmpeg.__aspawn__((
+                BrokenFFmpeg.which("ffprobe"),
+                "-v", "quiet",
+                "-print_format", "json",
+                "-show_format", "-show_streams",
+                "-i", path,
+            ), stdout=PIPE, echo=echo)
+            stdout, _ = await process.communicate()
+            data = json.loads(stdout)
+            BrokenFFmpeg.cache().set(key, data)
+
+        return FFmpegProbe.from_json(path, data)
+
+    @staticmethod
+    async def aget_frames(
+        path: Path,
+        *,
+        skip: int=0,
+        format: FFmpegPixelFormat=FFmpegPixelFormat.RGB24,
+        echo: bool=True
+    ) -> AsyncGenerator[numpy.ndarray, None]:
+        """Async BrokenFFmpeg.get_frames, yielding read-only frames as numpy arrays"""
+        if not (probe := await BrokenFFmpeg.aprobe(path, echo=echo)) or not probe.video:
+            return
+        format = FFmpegPixelFormat.get(format)
+        (width, height) = (probe.video.width, probe.video.height)
+        framerate = (probe.video.framerate or probe.video.avg_rate)
+        start = max(0, (skip - 0.5)/framerate) if skip else 0
+        shape = format.shape(width, height)
+        size  = format.size(width, height)
+
+        process = await BrokenFFmpeg.__raw_video__(probe.path, start=start, format=format).apopen(
+            stdout=PIPE, stderr=DEVNULL, limit=2*size, echo=echo)
+        try:
+            while True:
+                try:
+                    raw = await process.stdout.readexactly(size)
+                except asyncio.IncompleteReadError:
+                    break
+                yield numpy.frombuffer(raw, dtype=format.dtype).reshape(shape)
+        finally:
+            if (process.returncode is None):
+                process.kill()
+                await process.wait()
+
     # ---------------------------------------------------------------------------------------------|
     # High level functions
 
+    # # Probing
+
+    _cache = None
+
+    @staticmethod
+    def cache():
+        """Persistent on-disk cache of media metadata, keyed by file identity"""
+        if BrokenFFmpeg._cache is None:
+            import diskcache
+            BrokenFFmpeg._cache = diskcache.Cache(Broken.BROKEN.DIRECTORIES.CACHE/"BrokenFFmpeg")
+        return BrokenFFmpeg._cache
+
+    @staticmethod
+    def __identity__(path: Path) -> Tuple[str, int, int]:
+        """A file's (path, size, mtime) tuple, changes whenever the file is modified"""
+        stat = Path(path).stat()
+        return (str(path), stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def probe(path: Path, *, echo: bool=True) -> Optional[FFmpegProbe]:
+        """
+        Get all container and streams metadata of a media file with a single ffprobe call
+        • Results are cached on disk by file identity, so calls across restarts are cheap
+
+        Returns:
+            FFmpegProbe object if the file exists, else None
+        """
+        if not (path := BrokenPath(path).valid()):
+            return None
+        return BrokenFFmpeg.__probe__(BrokenFFmpeg.__identity__(path), echo=echo)
+
     @staticmethod
     @functools.lru_cache
+    def __probe__(identity: Tuple[str, int, int], *, echo: bool=True) -> FFmpegProbe:
+        path = BrokenPath(identity[0])
+        key  = ("probe", *identity)
+
+        if (data := BrokenFFmpeg.cache().get(key)) is None:
+            BrokenFFmpeg.install()
+            log.minor(f"Probing media file ({path})", echo=echo)
+            data = json.loads(shell(
+                BrokenFFmpeg.which("ffprobe"),
+                "-v", "quiet",
+                "-print_format", "json",
+                "-show_format", "-show_streams",
+                "-i", path,
+                output=True, echo=echo
+            ))
+            BrokenFFmpeg.cache().set(key, data)
+
+        return FFmpegProbe.from_json(path, data)
+
+    @staticmethod
     def get_resolution(path: Path, *, echo: bool=True) -> Tuple[Optional[int], Optional[int]]:
-        """Get the resolution of a video in a smart way"""
-        if not (path := BrokenPath(path).valid()):
+        """Get the resolution of a video or image"""
+        if not (stream := getattr(BrokenFFmpeg.probe(path, echo=echo), "video", None)):
             return (None, None)
-        BrokenFFmpeg.install()
-        log.minor(f"Getting Video Resolution of ({path})")
-        return PIL.Image.open(io.BytesIO(
-            (BrokenFFmpeg()
-                .quiet()
-                .input(path)
-                .advanced("-vframes", "1")
-                .format(FFmpegFormat.Image2pipe)
-                .output("-")
-            ).run(stdout=PIPE, echo=echo).stdout
-        ), formats=["jpeg"]).size
+        return (stream.width, stream.height)
 
     @staticmethod
-    def get_frames(path: Path, *, skip: int=0, echo: bool=True) -> Optional[Iterable[numpy.ndarray]]:
-        """Generator for every frame of the video as numpy arrays, FAST!"""
-        if not (path := BrokenPath(path).valid()):
-            return None
-        BrokenFFmpeg.install()
-        log.minor(f"Streaming Video Frames from file ({path})")
-        (width, height) = BrokenFFmpeg.get_resolution(path)
-        ffmpeg = (BrokenFFmpeg()
+    def __raw_video__(
+        path: Path,
+        *,
+        start: Seconds=0,
+        frames: int=None,
+        format: FFmpegPixelFormat=FFmpegPixelFormat.RGB24,
+    ) -> BrokenFFmpeg:
+        """
+        Build a FFmpeg command decoding a video to raw frames on stdout
+
+        Args:
+            `format`: Pixel format of the raw frames, see FFmpegPixelFormat.shape
+            `start`:  Keyframe-aware input seek (-ss before -i), then precise decoding up to it.
+                Seeking passes frames through, as constant framerate would duplicate the first
+                one to fill the gap between zero and its (half a frame later) timestamp
+            `frames`: Stop after this many frames, else until the end
+        """
+        return (BrokenFFmpeg()
             .hwaccel(FFmpegHWAccel.Auto)
-            .vsync(FFmpegVsync.ConstantFramerate)
+            .vsync(FFmpegVsync.Passthrough if start else FFmpegVsync.ConstantFramerate)
             .loglevel(FFmpegLogLevel.Panic)
+            .custom(*(("-ss", f"{start:.6f}") if start else ()))
             .input(path)
-            .filter(f"select='gte(n\\,{skip})'")
+            .custom(*(("-frames:v", frames) if (frames is not None) else ()))
             .video_codec(FFmpegVideoCodec.Rawvideo)
             .format(FFmpegFormat.Rawvideo)
-            .pixel_format(FFmpegPixelFormat.RGB24)
+            .pixel_format(format)
             .no_audio()
             .output("-")
-        ).Popen(stdout=PIPE, echo=echo)
+        )
+
+    @staticmethod
+    def get_frames(
+        path: Path,
+        *,
+        skip: int=0,
+        format: FFmpegPixelFormat=FFmpegPixelFormat.RGB24,
+        buffers: Union[int, List[numpy.ndarray]]=0,
+        workers: int=1,
+        chunk: int=48,
+        echo: bool=True
+    ) -> Optional[Iterable[numpy.ndarray]]:
+        """
+        Generator for every frame of the video as numpy arrays, FAST!
+
+        Args:
+            `skip`:    Start from this frame index, seeking to it
+            `format`:  Pixel format of the frames, defines their shape and dtype
+            `buffers`: Reuse a pool of this many (or these) arrays filled in place, a yielded
+                frame is then only valid until as many frames later. Zero for new arrays
+            `workers`: Decode as many keyframe-aligned segments in parallel processes
+            `chunk`:   Minimum frames of the keyframe-aligned chunks parallel workers decode, and
+                the most frames each of the `workers` decoders buffers ahead of being consumed
+        """
+        if not (path := BrokenPath(path).valid()):
+            return None
+        BrokenFFmpeg.install()
+        log.minor(f"Streaming Video Frames from file ({path})")
+        (width, height) = BrokenFFmpeg.get_resolution(path)
+        framerate = BrokenFFmpeg.get_framerate(path, echo=False)
+        format = FFmpegPixelFormat.get(format)
+
+        if (workers > 1):
+            if buffers:
+                raise ValueError("Reusing buffers isn't possible with parallel workers, frames are decoded ahead")
+            yield from BrokenFFmpeg.__parallel_frames__(path,
+                skip=skip, format=format, workers=workers, chunk=chunk, echo=echo)
+            return
 
-        # Keep reading frames until we run out, each pixel is 3 bytes !
-        while (raw := ffmpeg.stdout.read(width * height * 3)):
-            yield numpy.frombuffer(raw, dtype=numpy.uint8).reshape((height, width, 3))
+        # Either a user pool, a new pool, or brand new arrays each frame
+        if isinstance(buffers, int):
+            buffers = [format.empty(width, height) for _ in range(buffers)]
+        elif any((frame.nbytes != format.size(width, height)) for frame in buffers):
+            raise ValueError(f"All buffers must have the frame shape {format.shape(width, height)}")
+        frames = itertools.cycle(buffers) if buffers else (format.empty(width, height) for _ in itertools.count())
+
+        # Seek to half a frame before the skipped one, as the decoder drops all frames before it
+        start = max(0, (skip - 0.5)/framerate) if skip else 0
+        ffmpeg = BrokenFFmpeg.__raw_video__(path, start=start, format=format).Popen(stdout=PIPE, echo=echo)
+
+        # Keep filling frames until we run out
+        while _readinto(ffmpeg.stdout, frame := next(frames)):
+            yield frame
 
     @staticmethod
-    @functools.lru_cache
-    def get_total_frames(path: Path, *, echo: bool=True) -> Optional[int]:
-        """Count the total frames of a video by decode voiding and parsing stats output"""
+    def get_keyframes(path: Path, *, echo: bool=True) -> Optional[List[int]]:
+        """
+        Get the frame indices of every keyframe of a video by demuxing only, cached by file identity
+        """
+        if not (path := BrokenPath(path).valid()):
+            return None
+        key = ("keyframes", *BrokenFFmpeg.__identity__(path))
+
+        if (keyframes := BrokenFFmpeg.cache().get(key)) is not None:
+            return keyframes
+
+        BrokenFFmpeg.install()
+        framerate = BrokenFFmpeg.get_framerate(path, echo=False)
+        with BrokenSpinner(log.minor(f"Finding keyframes of ({path})", echo=echo)):
+            packets = shell(
+                BrokenFFmpeg.which("ffprobe"),
+                "-v", "quiet",
+                "-select_streams", "v:0",
+                "-show_entries", "packet=pts_time,flags",
+                "-of", "csv=p=0",
+                "-i", path,
+                output=True, echo=echo
+            ).splitlines()
+
+        # Lines are "pts_time,flags", keyframes have a 'K' flag
+        times = [float(pts) for pts, flags, *_ in (line.split(",") for line in packets if line)
+            if ("K" in flags) and (pts != "N/A")]
+        origin = min(times, default=0)
+        keyframes = sorted({round((time - origin)*framerate) for time in times})
+        BrokenFFmpeg.cache().set(key, keyframes)
+        return keyframes
+
+    @staticmethod
+    def __parallel_frames__(
+        path: Path,
+        *,
+        skip: int=0,
+        format: FFmpegPixelFormat=FFmpegPixelFormat.RGB24,
+        workers: int=4,
+        chunk: int=48,
+        echo: bool=True
+    ) -> Generator[numpy.ndarray, None, None]:
+        """
+        Split the video at keyframes into many short chunks, decoded by concurrent FFmpeg processes
+        pulling the next chunk from a shared counter, yielded in order through a reorder window
+        • The window is `workers` chunks wide: decoders never run further ahead than that
+        • Each chunk buffers at most `chunk` frames, decoders of long keyframe intervals wait for
+          the consumer, so memory is bounded by `workers*chunk` frames, whatever the video
+        """
+        (width, height) = BrokenFFmpeg.get_resolution(path)
+        framerate = BrokenFFmpeg.get_framerate(path, echo=False)
+        total     = BrokenFFmpeg.get_total_frames(path, echo=echo)
+        keyframes = [frame for frame in BrokenFFmpeg.get_keyframes(path, echo=echo) if skip < frame < total]
+
+        # Split at the first keyframe at least a chunk after the previous split
+        splits = [skip]
+        for frame in keyframes:
+            if (frame - splits[-1]) >= chunk:
+                splits.append(frame)
+        chunks = [(start, end - start) for start, end in zip(splits, splits[1:])]
+        chunks.append((splits[-1], None))
+        log.minor(f"Decoding ({path}) in {len(chunks)} chunks over {workers} parallel workers", echo=echo)
+
+        queues    = [Queue(maxsize=chunk) for _ in chunks]
+        condition = Condition()
+        state     = DotMap(taken=0, consumed=0, stop=False)
+
+        def worker():
+            while True:
+                with condition:
+                    condition.wait_for(lambda: state.stop or (state.taken >= len(chunks)) or
+                        (state.taken < state.consumed + workers))
+                    if state.stop or (state.taken >= len(chunks)):
+                        return
+                    index = state.taken
+                    state.taken += 1
+
+                # Wait for room on the chunk's queue, unless the consumer is gone
+                def put(item: Optional[numpy.ndarray]) -> None:
+                    while (not state.stop):
+                        with contextlib.suppress(Full):
+                            return queues[index].put(item, timeout=0.1)
+
+                start, frames = chunks[index]
+                ffmpeg = BrokenFFmpeg.__raw_video__(path,
+                    start=max(0, (start - 0.5)/framerate) if start else 0,
+                    frames=frames, format=format).Popen(stdout=PIPE, echo=False)
+                try:
+                    while (not state.stop) and _readinto(ffmpeg.stdout, frame := format.empty(width, height)):
+                        put(frame)
+                finally:
+                    ffmpeg.kill()
+                    ffmpeg.wait()
+                    put(None)
+
+        threads = [BrokenThread.new(worker, daemon=True) for _ in range(workers)]
+
+        try:
+            for index, queue in enumerate(queues):
+                while (frame := queue.get()) is not None:
+                    yield frame
+
+                # Free the chunk and slide the window
+                queues[index] = None
+                with condition:
+                    state.consumed = (index + 1)
+                    condition.notify_all()
+        finally:
+            with condition:
+                state.stop = True
+                condition.notify_all()
+            for thread in threads:
+                thread.join()
+
+    @staticmethod
+    def count_frames(path: Path, *, exact: bool=False, echo: bool=True) -> Optional[FFmpegFrameCount]:
+        """
+        Count the total frames of a video with the cheapest method available, in order:
+        • Metadata: The container's `nb_frames`, free from the probe
+        • Packets:  Demux only with `-count_packets`, no decoding
+        • Decode:   Decode voiding to the null muxer and parse stats output, only if `exact`
+
+        Results are cached on disk by file identity
+        """
         if not (path := BrokenPath(path).valid()):
             return None
+        key = ("frames", *BrokenFFmpeg.__identity__(path), exact)
+
+        if (count := BrokenFFmpeg.cache().get(key)) is not None:
+            return FFmpegFrameCount(*count)
+
+        if exact:
+            count = FFmpegFrameCount(
+                frames=BrokenFFmpeg.__decode_frames__(path, echo=echo),
+                method=FFmpegFrameCountMethod.Decode,
+            )
+        elif (frames := getattr(BrokenFFmpeg.probe(path, echo=echo).video, "frames", None)):
+            count = FFmpegFrameCount(frames=frames, method=FFmpegFrameCountMethod.Metadata)
+        elif (frames := BrokenFFmpeg.__count_packets__(path, echo=echo)):
+            count = FFmpegFrameCount(frames=frames, method=FFmpegFrameCountMethod.Packets)
+        else:
+            return BrokenFFmpeg.count_frames(path, exact=True, echo=echo)
+
+        BrokenFFmpeg.cache().set(key, (count.frames, count.method.value))
+        return count
+
+    @staticmethod
+    def __count_packets__(path: Path, *, echo: bool=True) -> Optional[int]:
+        """Count the video packets by demuxing only, one packet is one frame on most codecs"""
         BrokenFFmpeg.install()
-        with BrokenSpinner(log.minor(f"Getting video total frames of ({path}), might take a while..")):
+        with BrokenSpinner(log.minor(f"Counting video packets of ({path})", echo=echo)):
+            return _number(shell(
+                BrokenFFmpeg.which("ffprobe"),
+                "-v", "quiet",
+                "-select_streams", "v:0",
+                "-count_packets",
+                "-show_entries", "stream=nb_read_packets",
+                "-of", "csv=p=0",
+                "-i", path,
+                output=True, echo=echo
+            ).strip().split(",")[0], int)
+
+    @staticmethod
+    def __decode_frames__(path: Path, *, echo: bool=True) -> int:
+        """Count the total frames of a video by decode voiding and parsing stats output"""
+        BrokenFFmpeg.install()
+        with BrokenSpinner(log.minor(f"Getting video total frames of ({path}), might take a while..", echo=echo)):
             return int(re.compile(r"frame=\s*(\d+)").findall((BrokenFFmpeg()
                 .vsync(FFmpegVsync.ConstantFramerate)
                 .input(path)
@@ -1133,80 +1892,57 @@ class BrokenFFmpeg:
             ).run(stderr=PIPE, echo=echo).stderr.decode())[-1])
 
     @staticmethod
-    @functools.lru_cache
+    def get_total_frames(path: Path, *, exact: bool=False, echo: bool=True) -> Optional[int]:
+        """Count the total frames of a video, see BrokenFFmpeg.count_frames"""
+        if not (count := BrokenFFmpeg.count_frames(path, exact=exact, echo=echo)):
+            return None
+        return count.frames
+
+    @staticmethod
     def get_video_duration(path: Path, *, echo: bool=True) -> Optional[Seconds]:
         """Get the duration of a video"""
-        if not (path := BrokenPath(path).valid()):
+        if not (probe := BrokenFFmpeg.probe(path, echo=echo)):
             return None
-        BrokenFFmpeg.install()
-        log.minor(f"Getting Video Duration of file ({path})")
-        return float(shell(
-            BrokenPath.which("ffprobe"),
-            "-i", path,
-            "-show_entries", "format=duration",
-            "-v", "quiet", "-of", "csv=p=0",
-            output=True, echo=echo
-        ))
+        return probe.duration or getattr(probe.video, "duration", None)
 
     @staticmethod
-    @functools.lru_cache
     def get_framerate(path: Path, *, precise: bool=False, echo: bool=True) -> Optional[Hertz]:
         """Get the framerate of a video"""
-        if not (path := BrokenPath(path).valid()):
+        if not (probe := BrokenFFmpeg.probe(path, echo=echo)):
             return None
-        BrokenFFmpeg.install()
-        log.minor(f"Getting Video Framerate of file ({path})", echo=echo)
         if precise:
             A = BrokenFFmpeg.get_total_frames(path, echo=False)
             B = BrokenFFmpeg.get_video_duration(path, echo=False)
             return (A/B)
-        else:
-            return float(flatten(eval(shell(
-                BrokenPath.which("ffprobe"),
-                "-i", path,
-                "-show_entries", "stream=r_frame_rate",
-                "-v", "quiet", "-of", "csv=p=0",
-                output=True, echo=echo
-            ).splitlines()[0]))[0])
+        return getattr(probe.video, "framerate", None)
 
     @staticmethod
-    @functools.lru_cache
     def get_samplerate(path: Path, *, stream: int=0, echo: bool=True) -> Optional[Hertz]:
         """Get the samplerate of a audio file"""
-        if not (path := BrokenPath(path).valid()):
+        if not (probe := BrokenFFmpeg.probe(path, echo=echo)):
             return None
-        BrokenFFmpeg.install()
-        log.minor(f"Getting Audio Samplerate of file ({path})", echo=echo)
-        return int(shell(
-            BrokenPath.which("ffprobe"),
-            "-i", path,
-            "-show_entries", "stream=sample_rate",
-            "-v", "quiet", "-of", "csv=p=0",
-            output=True, echo=echo
-        ).strip().splitlines()[stream])
+        if (stream >= len(streams := probe.audio_streams)):
+            return None
+        return streams[stream].samplerate
 
     @staticmethod
-    @functools.lru_cache
     def get_audio_channels(path: Path, *, stream: int=0, echo: bool=True) -> Optional[int]:
         """Get the number of channels of a audio file"""
-        if not (path := BrokenPath(path).valid()):
+        if not (probe := BrokenFFmpeg.probe(path, echo=echo)):
             return None
-        BrokenFFmpeg.install()
-        log.minor(f"Getting Audio Channels of file ({path})", echo=echo)
-        return int(shell(
-            BrokenPath.which("ffprobe"),
-            "-i", path,
-            "-show_entries", "stream=channels",
-            "-v", "quiet", "-of", "csv=p=0",
-            output=True, echo=echo
-        ).strip().splitlines()[stream])
+        if (stream >= len(streams := probe.audio_streams)):
+            return None
+        return streams[stream].channels
 
     @staticmethod
     def get_audio_duration(path: Path, *, echo: bool=True) -> Optional[Seconds]:
-        if not (path := BrokenPath(path).valid()):
-            return
+        """Get the duration of an audio file from metadata, decoding it only if unknown"""
+        if not (probe := BrokenFFmpeg.probe(path, echo=echo)):
+            return None
+        if (duration := getattr(probe.audio, "duration", None) or probe.duration):
+            return duration
         try:
-            generator = BrokenAudioReader(path=path, chunk=10).stream
+            generator = BrokenAudioReader(path=probe.path, chunk=10).stream
             while next(generator) is not None: ...
         except StopIteration as result:
             return result.value
@@ -1214,18 +1950,390 @@ class BrokenFFmpeg:
 # -------------------------------------------------------------------------------------------------|
 # BrokenFFmpeg Spin-offs
 
+@define(frozen=True)
+class BrokenFFmpegTemplate:
+    """
+    An immutable, compiled BrokenFFmpeg command with `{name}` placeholders, see BrokenFFmpeg.compile
+    • Instantiating is a list copy and a few substitutions, no builder or binary lookups
+    """
+    tokens: Tuple[str, ...]
+
+    slots: Tuple[Tuple[int, str], ...] = ()
+    """(index, name) of arguments that are a whole placeholder, replaced by any value"""
+
+    formats: Tuple[int, ...] = ()
+    """Indices of arguments with placeholders among other text, filled with str.format"""
+
+    @staticmethod
+    def placeholder(value: Any) -> Optional[str]:
+        """The name of a whole `{name}` placeholder string, else None"""
+        if isinstance(value, str) and (match := re.fullmatch(r"\{(\w+)\}", value)):
+            return match.group(1)
+        return None
+
+    @staticmethod
+    def from_command(command: List[Any]) -> BrokenFFmpegTemplate:
+        tokens = tuple(map(str, command))
+        return BrokenFFmpegTemplate(
+            tokens=tokens,
+            slots=tuple((index, name) for index, token in enumerate(tokens)
+                if (name := BrokenFFmpegTemplate.placeholder(token))),
+            formats=tuple(index for index, token in enumerate(tokens)
+                if re.search(r"\{\w+\}", token) and not BrokenFFmpegTemplate.placeholder(token)),
+        )
+
+    @property
+    def names(self) -> set[str]:
+        return {name for _, name in self.slots} | {
+            name for index in self.formats for name in re.findall(r"\{(\w+)\}", self.tokens[index])}
+
+    def command(self, **values: Any) -> List[str]:
+        """Fill the placeholders, returns the final command"""
+        command = list(self.tokens)
+        for index, name in self.slots:
+            command[index] = str(values[name])
+        for index in self.formats:
+            command[index] = command[index].format(**values)
+        return command
+
+    def __call__(self, **values: Any) -> List[str]:
+        return self.command(**values)
+
+    def run(self, values: Dict[str, Any], **kwargs) -> subprocess.CompletedProcess:
+        return shell(self.command(**values), **kwargs)
+
+    def Popen(self, values: Dict[str, Any], **kwargs) -> subprocess.Popen:
+        return shell(self.command(**values), Popen=True, **kwargs)
+
+@define
+class FFmpegJob:
+    """A BrokenFFmpeg command on a BrokenFFmpegBatch, and how it went"""
+    ffmpeg:     BrokenFFmpeg
+    returncode: Optional[int] = None
+    attempts:   int           = 0
+    elapsed:    Seconds       = 0
+    skipped:    bool          = False
+    stderr:     str           = field(default="", repr=False)
+    """Tail of the last attempt's stderr, the reason of failures"""
+
+    @property
+    def ok(self) -> bool:
+        return self.skipped or (self.returncode == 0)
+
+    @property
+    def inputs(self) -> List[Path]:
+        """Existing files after every `-i` of the command"""
+        command = self.ffmpeg.command
+        return [path for option, value in zip(command, command[1:])
+            if (option == "-i") and (path := BrokenPath(value).valid()) and path.is_file()]
+
+    @property
+    def output(self) -> Optional[Path]:
+        """The command's output file, the last argument, if it isn't a pipe"""
+        if (output := self.ffmpeg.command[-1]) in ("-", "pipe:", "pipe:1"):
+            return None
+        return BrokenPath(output)
+
+    @property
+    def uptodate(self) -> bool:
+        """The output exists, isn't empty, and is newer than all inputs"""
+        if not (output := self.output) or (not BrokenPath.non_empty_file(output)):
+            return False
+        return all(output.stat().st_mtime >= input.stat().st_mtime for input in self.inputs)
+
+@define
+class BrokenFFmpegBatch:
+    """
+    Run many BrokenFFmpeg commands concurrently, retrying failures and skipping done work
+
+    • Outputs are first written to a `.partial` file renamed on success, so an interrupted
+      batch never leaves complete-looking outputs behind, and reruns skip finished ones
+
+    ```python
+    batch = BrokenFFmpegBatch(threads=4)
+    batch.template(lambda path: (BrokenFFmpeg()
+        .input(path)
+        .video_codec(FFmpegVideoCodec.H264)
+        .output(path.with_suffix(".h264.mp4"))
+    ), inputs=Path("videos").glob("*.mkv"))
+
+    for job in batch.run():
+        print(job.output, job.returncode, job.elapsed)
+    ```
+    """
+    jobs: List[FFmpegJob] = Factory(list)
+
+    threads: int = 1
+    """Threads each encoder uses, only to derive the default parallelism"""
+
+    workers: int = None
+    """Jobs running at once, defaults to the CPU count divided by encoder threads"""
+
+    retries: int = 1
+    """Extra attempts for failed jobs"""
+
+    echo: bool = False
+
+    def add(self, *ffmpegs: BrokenFFmpeg) -> Self:
+        self.jobs.extend(FFmpegJob(ffmpeg=ffmpeg) for ffmpeg in flatten(ffmpegs))
+        return self
+
+    def template(self, builder: Callable[[Path], BrokenFFmpeg], inputs: Iterable[Path]) -> Self:
+        """Add a command built for every input path"""
+        return self.add(*map(builder, map(BrokenPath, inputs)))
+
+    @property
+    def parallel(self) -> int:
+        return max(1, self.workers or ((os.cpu_count() or 1)//max(1, self.threads)))
+
+    def __job__(self, job: FFmpegJob) -> FFmpegJob:
+        if job.uptodate:
+            log.minor(f"Skipping up to date output ({job.output})", echo=self.echo)
+            job.skipped = True
+            return job
+
+        # Write to a partial file, the extension is kept for FFmpeg to guess the muxer
+        command = job.ffmpeg.command
+        if (output := job.output):
+            partial = output.with_name(f"{Path(output).stem}.partial{output.suffix}")
+            command = [command[0], "-y", *command[1:-1], partial]
+
+        start = time.perf_counter()
+        while (job.attempts <= self.retries):
+            job.attempts += 1
+            process = shell(command, stdin=DEVNULL, stdout=DEVNULL, stderr=PIPE, echo=self.echo)
+            job.returncode = process.returncode
+            job.stderr = process.stderr.decode(errors="replace").strip()[-2000:]
+            if (job.returncode == 0):
+                break
+            log.warning(f"BrokenFFmpeg job failed with code {job.returncode} (attempt {job.attempts}): {command}\n{job.stderr}")
+        job.elapsed = (time.perf_counter() - start)
+
+        if output and (job.returncode == 0):
+            partial.replace(output)
+        elif output:
+            BrokenPath.remove(partial, echo=False)
+        return job
+
+    def run(self) -> List[FFmpegJob]:
+        """Run all jobs, returns them in order with their exit codes and timings"""
+        log.info(f"Running {len(self.jobs)} BrokenFFmpeg jobs, {self.parallel} at a time")
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            jobs = list(pool.map(self.__job__, self.jobs))
+        if (failed := [job for job in jobs if not job.ok]):
+            log.error(f"{len(failed)} of {len(jobs)} BrokenFFmpeg jobs failed:")
+            for job in failed:
+                log.error(f"• ({job.output}) code {job.returncode}: {(job.stderr.splitlines() or [''])[-1]}")
+        return jobs
+
+@define
+class BrokenFFmpegAsyncWriter:
+    """
+    Writes frames to a BrokenFFmpeg asyncio subprocess with backpressure: each `await .write()`
+    only returns once the pipe has drained below its high-water mark, pausing the producer
+    """
+    ffmpeg:   BrokenFFmpeg
+    echo:     bool = True
+    stats:    FFmpegPipeStats = Factory(FFmpegPipeStats)
+    _process: asyncio.subprocess.Process = None
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def write(self, frame: Any) -> None:
+        if (self._process is None):
+            self._process = await self.ffmpeg.apopen(stdin=PIPE, echo=self.echo)
+        if isinstance(frame, numpy.ndarray) and (not frame.flags.c_contiguous):
+            frame = numpy.ascontiguousarray(frame)
+        view = memoryview(frame).cast("B")
+        self._process.stdin.write(view)
+        start = time.perf_counter()
+        await self._process.stdin.drain()
+        self.stats.stalled += (time.perf_counter() - start)
+        self.stats.frames  += 1
+        self.stats.bytes   += view.nbytes
+
+    async def close(self) -> int:
+        """Close stdin and wait for FFmpeg to finish, returns the exit code"""
+        if (self._process is None):
+            return 0
+        self._process.stdin.close()
+        await self._process.stdin.wait_closed()
+        log.info(f"BrokenFFmpeg: {self.stats}", echo=self.echo)
+        return await self._process.wait()
+
+@define
+class BrokenVideoReader:
+    """
+    Random access to a video's frames, with keyframe-aware seeking and a small LRU of frames
+
+    • Sequential or short forward reads continue the running decoder
+    • Far or backwards reads restart it with an input seek (-ss before -i), which jumps to the
+      nearest keyframe and only decodes from there up to the wanted frame
+
+    ```python
+    reader = BrokenVideoReader("input.mp4")
+    reader[50_000]          # Single frame
+    reader[100:200:2]       # Generator of frames
+    reader.at(seconds=12.5) # Frame shown at a time
+    ```
+    """
+    path:    Path = field(converter=BrokenPath)
+    cache:   int  = 8
+    """Maximum recently decoded frames to keep"""
+
+    forward: int  = 64
+    """Maximum frames ahead to decode through instead of seeking"""
+
+    format:  FFmpegPixelFormat = FFmpegPixelFormat.RGB24.field()
+    echo:    bool = False
+
+    _width:     int         = None
+    _height:    int         = None
+    _framerate: Hertz       = None
+    _frames:    int         = None
+    _position:  int         = 0
+    _ffmpeg:    Popen       = None
+    _lru:       OrderedDict = Factory(OrderedDict)
+    _scratch:   numpy.ndarray = None
+
+    def __attrs_post_init__(self):
+        if not (probe := BrokenFFmpeg.probe(self.path, echo=self.echo)) or not probe.video:
+            raise FileNotFoundError(log.error(f"Couldn't find a video stream on ({self.path})"))
+        self._width     = probe.video.width
+        self._height    = probe.video.height
+        self._framerate = (probe.video.framerate or probe.video.avg_rate)
+        self._frames    = BrokenFFmpeg.get_total_frames(self.path, echo=self.echo)
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @property
+    def height(self) -> int:
+        return self._height
+
+    @property
+    def framerate(self) -> Hertz:
+        return self._framerate
+
+    @property
+    def duration(self) -> Seconds:
+        return (self._frames/self._framerate)
+
+    def __len__(self) -> int:
+        return self._frames
+
+    # # Decoder process
+
+    def __seek__(self, index: int) -> None:
+        """Restart the decoder at a frame, half a frame before it to be safe from rounding"""
+        self.close()
+        start = max(0, (index - 0.5)/self.framerate)
+        self._ffmpeg = (BrokenFFmpeg.__raw_video__(self.path, start=start, format=self.format)
+            .Popen(stdout=PIPE, echo=self.echo))
+        self._position = index
+
+    def __read__(self, frame: numpy.ndarray=None) -> Optional[numpy.ndarray]:
+        """Read the next frame of the running decoder, into a given array or a new one"""
+        if frame is None:
+            frame = self.format.empty(self.width, self.height)
+        if not _readinto(self._ffmpeg.stdout, frame):
+            return None
+        self._position += 1
+        return frame
+
+    def close(self) -> None:
+        if self._ffmpeg is not None:
+            self._ffmpeg.kill()
+            self._ffmpeg.wait()
+            self._ffmpeg = None
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    # # Access
+
+    def frame(self, index: int) -> numpy.ndarray:
+        """Get a frame by its index, negative indices count from the end"""
+        if (index := (index + len(self) if (index < 0) else index)) not in range(len(self)):
+            raise IndexError(f"Frame {index} out of range for video with {len(self)} frames")
+
+        # Recently decoded frame
+        if (frame := self._lru.get(index)) is not None:
+            self._lru.move_to_end(index)
+            return frame
+
+        # Seek if the decoder is behind, too far ahead or not running
+        if (self._ffmpeg is None) or not (0 <= (index - self._position) <= self.forward):
+            self.__seek__(index)
+
+        # Decode through skipped frames into a scratch array, the wanted one into a new array
+        if (self._scratch is None):
+            self._scratch = self.format.empty(self.width, self.height)
+        while (self._position <= index):
+            if (frame := self.__read__(None if (self._position == index) else self._scratch)) is None:
+                raise IndexError(f"Frame {index} couldn't be decoded, the video might be shorter")
+
+        self._lru[index] = frame
+        while len(self._lru) > self.cache:
+            self._lru.popitem(last=False)
+        return frame
+
+    def at(self, seconds: Seconds) -> numpy.ndarray:
+        """Get the frame shown at a time"""
+        return self.frame(min(int(seconds*self.framerate), len(self) - 1))
+
+    def between(self, start: Seconds, end: Seconds, step: int=1) -> Generator[numpy.ndarray, None, None]:
+        """Get all frames shown between two times"""
+        yield from self[int(start*self.framerate):int(end*self.framerate):step]
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[numpy.ndarray, Generator[numpy.ndarray, None, None]]:
+        if isinstance(key, slice):
+            return (self.frame(index) for index in range(*key.indices(len(self))))
+        return self.frame(key)
+
+    def __iter__(self) -> Generator[numpy.ndarray, None, None]:
+        return self[:]
+
 @define
 class BrokenAudioReader:
+    """
+    Read an audio file as numpy arrays of (samples, channels)
+
+    • Stream it from start to end in chunks with `.stream`
+    • Random access sample-accurate windows with `.read(start, duration)` or `reader[t0:t1]`,
+      consecutive windows continue the running decoder, others restart it with an input seek
+    • With `cache=True`, the audio is decoded once to the project's cache directory and then
+      memory mapped, so any later reads are zero-copy page-ins across renders
+    """
     path:        Path
     chunk:       Seconds     = 0.1
     format:      FFmpegPCM   = FFmpegPCM.PCM_FLOAT_32_BITS_LITTLE_ENDIAN
     echo:        bool        = False
+
+    cache: bool = False
+    """Decode once to a memory mapped file on the cache directory"""
+
+    cache_limit: int = 4*2**30
+    """Maximum bytes of all cached audio, least recently used files are evicted"""
+
     _time:       Seconds     = 0
     _channels:   int         = None
     _samplerate: Hertz       = None
+    _duration:   Seconds     = None
     _dtype:      numpy.dtype = None
     _size:       int         = 4
     _ffmpeg:     Popen       = None
+    _reader:     Popen       = None
+    _position:   int         = 0
+    _pcm:        numpy.memmap = None
 
     @property
     def time(self) -> Seconds:
@@ -1239,6 +2347,12 @@ class BrokenAudioReader:
     def samplerate(self) -> Hertz:
         return self._samplerate
 
+    @property
+    def duration(self) -> Seconds:
+        """Duration of the audio from the container metadata, no decoding"""
+        self.__setup__()
+        return self._duration
+
     @property
     def dtype(self) -> numpy.dtype:
         return self._dtype
@@ -1255,24 +2369,29 @@ class BrokenAudioReader:
     def bytes_per_sample(self) -> int:
         return (self.size * self.channels)
 
-    @property
-    def stream(self) -> Generator[numpy.ndarray, None, None]:
-        self.path = BrokenPath(self.path).valid()
-        if (self.path is None):
-            return None
-
-        # Get audio file attributes
-        self._channels   = BrokenFFmpeg.get_audio_channels(self.path, echo=self.echo)
-        self._samplerate = BrokenFFmpeg.get_samplerate(self.path, echo=self.echo)
+    def __setup__(self) -> bool:
+        """Get the audio file attributes, returns whether the file is valid"""
+        if (self._samplerate is not None):
+            return True
+        if not (probe := BrokenFFmpeg.probe(self.path, echo=self.echo)) or not (audio := probe.audio):
+            return False
+        self.path        = probe.path
+        self._channels   = audio.channels
+        self._samplerate = audio.samplerate
+        self._duration   = (audio.duration or probe.duration)
         self.format = FFmpegPCM.get(self.format)
         self._dtype = self.format.dtype
-        self._size = self.format.size
-        self._time = 0
+        self._size  = self.format.size
+        return True
 
-        # Note: Stderr to null as we might not read all the audio, won't log errors
-        self._ffmpeg = (
+    def __raw_audio__(self, start: Seconds=0, *, stderr: Any=DEVNULL) -> Popen:
+        """Spawn a FFmpeg decoding the audio to raw PCM on stdout, input seeking to a time"""
+
+        # Note: Stderr to null by default as we might not read all the audio, won't log errors
+        return (
             BrokenFFmpeg()
             .quiet()
+            .custom(*(("-ss", f"{start:.9f}") if start else ()))
             .input(self.path)
             .audio_codec(self.format.value)
             .format(self.format.value.removeprefix("pcm_"))
@@ -1280,7 +2399,87 @@ class BrokenAudioReader:
             .custom("-ar", self.samplerate)
             .custom("-ac", self.channels)
             .output("-")
-        ).Popen(stdout=PIPE, stderr=DEVNULL, echo=self.echo)
+        ).Popen(stdout=PIPE, stderr=stderr, echo=self.echo)
+
+    # # Decoded cache
+
+    @staticmethod
+    def cache_directory() -> Path:
+        """Decoded audio lives on the running project's cache, shared by all of its renders"""
+        return BrokenPath.mkdirs(Broken.PROJECT.DIRECTORIES.CACHE/"BrokenAudioReader", echo=False)
+
+    @property
+    def pcm(self) -> Optional[numpy.ndarray]:
+        """All samples memory mapped from the decoded cache, decoding it on the first call"""
+        if (self._pcm is not None):
+            return self._pcm
+        if not self.__setup__():
+            return None
+
+        # Any change to the source or the decoding parameters is a new file
+        key  = repr((BrokenFFmpeg.__identity__(self.path), self.format.value, self.samplerate, self.channels))
+        file = self.cache_directory()/f"{hashlib.sha256(key.encode()).hexdigest()[:32]}.{self.format.value}"
+
+        if file.exists():
+            os.utime(file)
+        else:
+            partial = file.with_suffix(".partial")
+            with BrokenSpinner(log.minor(f"Decoding audio ({self.path}) to cache ({file})", echo=self.echo)), \
+                tempfile.TemporaryFile() as errors:
+                ffmpeg = self.__raw_audio__(stderr=errors)
+                with open(partial, "wb") as output:
+                    while (data := ffmpeg.stdout.read(2**20)):
+                        output.write(data)
+
+                # Never cache a failed or truncated decode
+                if (ffmpeg.wait() != 0):
+                    partial.unlink(missing_ok=True)
+                    errors.seek(0)
+                    raise RuntimeError(log.error(
+                        f"Decoding audio ({self.path}) failed with code {ffmpeg.returncode}: "
+                        f"{errors.read().decode(errors='replace').strip()[-2000:]}"))
+            partial.replace(file)
+            self.__evict__(keep=file)
+
+        if not file.stat().st_size:
+            self._pcm = numpy.empty((0, self.channels), dtype=self.dtype)
+        else:
+            self._pcm = numpy.memmap(file, dtype=self.dtype, mode="r").reshape(-1, self.channels)
+        return self._pcm
+
+    def __evict__(self, keep: Path) -> None:
+        """Delete the least recently used decoded files until all fit in the size limit"""
+        files = sorted(self.cache_directory().glob("*.pcm_*"), key=lambda file: file.stat().st_mtime)
+        total = sum(file.stat().st_size for file in files)
+        for file in files:
+            if (total <= self.cache_limit):
+                break
+            if (file == keep):
+                continue
+            total -= file.stat().st_size
+            BrokenPath.remove(file, echo=self.echo)
+
+    # # Streaming
+
+    @property
+    def stream(self) -> Generator[numpy.ndarray, None, None]:
+        if not self.__setup__():
+            return None
+        self._time = 0
+
+        # Slice views of the mapped decoded file with the same time accounting
+        if self.cache:
+            pcm, offset, target = self.pcm, 0, 0
+            while (target := target + self.chunk):
+                length = max(1, round((target - self.time)*self.samplerate))
+                if not len(data := pcm[offset:offset + length]):
+                    break
+                offset += len(data)
+                self._time += len(data)/self.samplerate
+                yield data
+            return self.time
+
+        self._ffmpeg = self.__raw_audio__()
 
         """
         One could think the following code is the way, but it is not
@@ -1311,3 +2510,275 @@ class BrokenAudioReader:
             yield numpy.frombuffer(data, dtype=self.dtype).reshape(-1, self.channels)
 
         return self.time
+
+    def windows(self, size: Samples, hop: Samples=None) -> Generator[numpy.ndarray, None, Seconds]:
+        """
+        Stream overlapping (size, channels) windows every `hop` samples, for FFTs and alike
+        • Windows are views of a preallocated buffer filled in place from the pipe, no per-window
+          allocations, so they are only valid until the next one. Copy them to keep them
+        • The last partial hop is zero padded, time is read samples over samplerate, drift-free
+
+        Args:
+            `size`: Samples of each window
+            `hop`:  Samples between consecutive windows, defaults to no overlap
+        """
+        if not self.__setup__():
+            return None
+        hop = (hop or size)
+        if not (0 < hop <= size):
+            raise ValueError(f"Hop ({hop}) must be positive and at most the window size ({size})")
+        self._time = 0
+
+        # Already decoded, every window is a view of the mapped file, same windows as streaming
+        if self.cache:
+            pcm = self.pcm
+            for end in itertools.count(size, hop):
+                if (not len(pcm)) or ((end > size) and (end - hop >= len(pcm))):
+                    break
+                self._time = min(end, len(pcm))/self.samplerate
+                if (end <= len(pcm)):
+                    yield pcm[end - size:end]
+                    continue
+
+                # Only the last window is copied, zero padded
+                window = numpy.zeros((size, self.channels), dtype=self.dtype)
+                window[:len(pcm) - (end - size)] = pcm[end - size:]
+                yield window
+            return self.time
+
+        # Room for many hops, so moving the overlap back to the start never overlaps itself
+        keep     = (size - hop)
+        capacity = size + hop*max(8, -(-size//hop))
+        buffer   = numpy.zeros((capacity, self.channels), dtype=self.dtype)
+        self._ffmpeg = self.__raw_audio__()
+
+        def fill(samples: numpy.ndarray) -> int:
+            view, read = memoryview(samples).cast("B"), 0
+            while (read < view.nbytes) and (chunk := self._ffmpeg.stdout.readinto(view[read:])):
+                read += chunk
+            return (read//self.bytes_per_sample)
+
+        # The first window needs a full size of samples
+        total = fill(buffer[:size])
+        buffer[total:size] = 0
+        end = size
+
+        while total:
+            self._time = total/self.samplerate
+            yield buffer[end - size:end]
+
+            # Move the overlapping tail back to the start of the buffer
+            if (end + hop > capacity):
+                buffer[:keep] = buffer[end - keep:end]
+                end = keep
+
+            if not (read := fill(buffer[end:end + hop])):
+                break
+            buffer[end + read:end + hop] = 0
+            total += read
+            end   += hop
+
+        return self.time
+
+    # # Random access
+
+    def read(self, start: Seconds, duration: Seconds) -> Optional[numpy.ndarray]:
+        """
+        Get the samples between `start` and `start+duration` seconds, shorter near the end
+        • Times are rounded to the nearest sample, and the window has exactly that many samples
+        """
+        if not self.__setup__():
+            return None
+        first = max(0, round(start*self.samplerate))
+        count = max(0, round((start + duration)*self.samplerate) - first)
+
+        # Zero-copy view of the memory mapped decoded file
+        if self.cache:
+            return self.pcm[first:first + count]
+
+        # Restart the decoder unless this window continues the previous one
+        if (self._reader is None) or (first != self._position):
+            self.close()
+            self._reader   = self.__raw_audio__(start=first/self.samplerate)
+            self._position = first
+
+        samples = numpy.empty((count, self.channels), dtype=self.dtype)
+        view    = memoryview(samples).cast("B")
+        read    = 0
+        while (read < view.nbytes) and (chunk := self._reader.stdout.readinto(view[read:])):
+            read += chunk
+
+        # Trim at the end of the audio
+        samples = samples[:read//self.bytes_per_sample]
+        self._position += len(samples)
+        return samples
+
+    def __getitem__(self, key: slice) -> Optional[numpy.ndarray]:
+        """Samples between two times in seconds, `reader[1.5:3.0]`"""
+        if not isinstance(key, slice) or (key.step is not None):
+            raise TypeError("BrokenAudioReader only supports reader[start:end] slices in seconds")
+        start = (key.start or 0)
+        end   = (key.stop if (key.stop is not None) else self.duration)
+        return self.read(start, max(0, end - start))
+
+    def close(self) -> None:
+        if (self._reader is not None):
+            self._reader.kill()
+            self._reader.wait()
+            self._reader = None
+
+# -------------------------------------------------------------------------------------------------|
+
+@define
+class BrokenFFmpegRingWriter:
+    """
+    Writes frames to a BrokenFFmpeg process through a preallocated ring of frame-sized slots
+
+    • No busy waiting: producer and the stdin worker hand off slots with a condition variable
+    • No intermediate bytes: frames are copied once from any buffer-protocol object into a slot
+    • True zero-copy: render directly into `.reserve()`'d slots, then `.commit()` them
+
+    ```python
+    pipe = BrokenFFmpeg().(...).pipe()
+
+    # Any contiguous buffer, numpy arrays, bytes, bytearray
+    pipe.write(frame)
+
+    # ModernGL readbacks straight into the ring, the first reserve allocates it
+    fbo.read_into(pipe.reserve(size=width*height*3))
+    pipe.commit()
+
+    pipe.close()
+    ```
+    """
+    ffmpeg: Union[BrokenFFmpeg, Popen]
+    buffer: int = 10
+    stats:  FFmpegPipeStats = Factory(FFmpegPipeStats)
+
+    _ring:      numpy.ndarray = None
+    _sizes:     List[int]     = None
+    _head:      int           = 0
+    _tail:      int           = 0
+    _stop:      bool          = False
+    _error:     Exception     = None
+    _reserved:  bool          = False
+    _condition: Condition     = Factory(Condition)
+    _thread:    Thread        = None
+    _tracker:   BrokenFFmpegProgress = None
+
+    def __attrs_post_init__(self):
+        self._tracker = self.ffmpeg.tracker
+        self.ffmpeg  = self.ffmpeg.Popen(stdin=PIPE, bufsize=0)
+        self._sizes  = [0]*self.buffer
+        self._thread = BrokenThread.new(self.__worker__, daemon=True)
+
+    @property
+    def stdin(self) -> Self:
+        return self
+
+    @property
+    def pending(self) -> int:
+        """Frames on the ring not yet written to FFmpeg"""
+        return (self._head - self._tail)
+
+    def __allocate__(self, size: int) -> None:
+        """Allocate the ring on the first frame, as only then we know the frame size"""
+        if (self._ring is None) and (not size):
+            raise ValueError("The ring isn't allocated yet, the first .reserve() must be given a size")
+        elif (self._ring is None):
+            log.debug(f"BrokenFFmpeg: Allocating ring of {self.buffer} slots of {size} bytes")
+            self._ring = numpy.empty((self.buffer, size), dtype=numpy.uint8)
+        elif (size > self._ring.shape[1]):
+            raise ValueError(f"Frame of {size} bytes doesn't fit the ring slots of {self._ring.shape[1]} bytes")
+
+    def reserve(self, size: int=None) -> memoryview:
+        """
+        Wait for a free slot and return a writable view of it, must be followed by a `.commit()`
+
+        Args:
+            `size`: Bytes of the frame, only needed on the first call to allocate the ring
+        """
+        if self._reserved:
+            raise RuntimeError("A slot is already reserved, call .commit() first")
+        self.__allocate__(size or (self._ring.shape[1] if (self._ring is not None) else 0))
+
+        with self._condition:
+            if (self.pending >= self.buffer):
+                start = time.perf_counter()
+                while (self.pending >= self.buffer) and (self._error is None):
+                    self._condition.wait()
+                self.stats.stalled += (time.perf_counter() - start)
+            if self._error:
+                raise self._error
+
+        self._reserved = True
+        return memoryview(self._ring[self._head % self.buffer])
+
+    def commit(self, size: int=None) -> None:
+        """Hand the reserved slot over to the stdin worker, optionally with the used bytes"""
+        if not self._reserved:
+            raise RuntimeError("No slot was reserved, call .reserve() first")
+        self._reserved = False
+        self._sizes[self._head % self.buffer] = (size or self._ring.shape[1])
+        with self._condition:
+            self._head += 1
+            self._condition.notify_all()
+
+    def write(self, frame: Any) -> None:
+        """Copy a frame from any contiguous buffer into the ring, wait if it is full"""
+        if isinstance(frame, numpy.ndarray) and (not frame.flags.c_contiguous):
+            frame = numpy.ascontiguousarray(frame)
+        view = memoryview(frame).cast("B")
+        slot = self.reserve(size=view.nbytes)
+        slot[:view.nbytes] = view
+        self.commit(size=view.nbytes)
+
+    def close(self) -> None:
+        """Wait for all frames to be written and close the pipe"""
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        with BrokenSpinner() as spinner:
+            while self._thread.is_alive():
+                spinner.text = f"BrokenFFmpeg: Waiting for ({self.pending:4}) frames to be written to FFmpeg"
+                if self._tracker:
+                    spinner.text += f", {self._tracker.report}"
+                self._thread.join(timeout=0.1)
+            spinner.text = "BrokenFFmpeg: Waiting FFmpeg process to Finish"
+            self.ffmpeg.wait()
+        if self._tracker:
+            self._tracker.join()
+        log.info(f"BrokenFFmpeg: {self.stats}")
+
+    def __worker__(self):
+        try:
+            while True:
+                with self._condition:
+                    if (not self.pending) and (not self._stop):
+                        start = time.perf_counter()
+                        while (not self.pending) and (not self._stop):
+                            self._condition.wait()
+                        self.stats.starved += (time.perf_counter() - start)
+                    if (not self.pending):
+                        break
+                    slot = (self._tail % self.buffer)
+
+                # Write outside the lock, the producer may fill other slots meanwhile
+                size = self._sizes[slot]
+                view = memoryview(self._ring[slot])[:size]
+                while view:
+                    view = view[self.ffmpeg.stdin.write(view) or 0:]
+
+                with self._condition:
+                    self._tail += 1
+                    self.stats.frames += 1
+                    self.stats.bytes  += size
+                    self._condition.notify_all()
+
+        except (BrokenPipeError, OSError) as error:
+            log.error(f"BrokenFFmpeg: Pipe writer failed, did FFmpeg exit? ({error})")
+            with self._condition:
+                self._error = error
+                self._condition.notify_all()
+        finally:
+            self.ffmpeg.stdin.close()
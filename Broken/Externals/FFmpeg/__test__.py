@@ -0,0 +1,112 @@
+from . import *
+
+
+# Can the module and its dependents be imported?
+def test_initialization():
+    import Broken.Externals.Upscaler
+    import Broken.Externals.Upscaler.ncnn
+    ffmpeg = BrokenFFmpeg()
+    stats  = BrokenFFmpegAsyncWriter.__attrs_attrs__.stats
+    assert isinstance(stats.default.factory(), FFmpegPipeStats)
+
+# -------------------------------------------------------------------------------------------------|
+# Frame accurate seeking, compared to a sequential decode
+
+import shutil
+
+import pytest
+
+needs_ffmpeg = pytest.mark.skipif(not shutil.which("ffmpeg"), reason="FFmpeg binary not found")
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory) -> Path:
+    path = tmp_path_factory.mktemp("video")/"testsrc.mp4"
+    shell("ffmpeg", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", "testsrc=size=64x48:rate=30",
+        "-frames:v", 300, "-g", 30, "-pix_fmt", "yuv420p", path, echo=False)
+    return path
+
+@pytest.fixture(scope="module")
+def sequential(video) -> List[numpy.ndarray]:
+    return list(BrokenFFmpeg.get_frames(video, echo=False))
+
+def same(a: List[numpy.ndarray], b: List[numpy.ndarray]) -> bool:
+    return (len(a) == len(b)) and all(numpy.array_equal(x, y) for x, y in zip(a, b))
+
+@needs_ffmpeg
+def test_sequential(sequential):
+    assert len(sequential) == 300
+
+@needs_ffmpeg
+@pytest.mark.parametrize("skip", [1, 29, 30, 45, 100, 299])
+def test_get_frames_skip(video, sequential, skip):
+    assert same(list(BrokenFFmpeg.get_frames(video, skip=skip, echo=False)), sequential[skip:])
+
+@needs_ffmpeg
+@pytest.mark.parametrize("skip", [0, 1, 45, 100])
+def test_get_frames_parallel(video, sequential, skip):
+    frames = BrokenFFmpeg.get_frames(video, skip=skip, workers=3, chunk=20, echo=False)
+    assert same(list(frames), sequential[skip:])
+
+# Closing early mustn't hang on decoders waiting for room
+@needs_ffmpeg
+def test_get_frames_parallel_close(video, sequential):
+    frames = BrokenFFmpeg.get_frames(video, workers=3, chunk=4, echo=False)
+    assert numpy.array_equal(next(frames), sequential[0])
+    frames.close()
+
+@needs_ffmpeg
+def test_get_frames_parallel_buffers(video):
+    with pytest.raises(ValueError):
+        next(BrokenFFmpeg.get_frames(video, workers=2, buffers=2, echo=False))
+
+@needs_ffmpeg
+def test_reader(video, sequential):
+    reader = BrokenVideoReader(video)
+    assert numpy.array_equal(reader[100], sequential[100])
+    assert numpy.array_equal(reader[101], sequential[101])
+    assert numpy.array_equal(reader[5], sequential[5])
+    assert numpy.array_equal(reader[-1], sequential[-1])
+    assert numpy.array_equal(reader.at(5.0), sequential[150])
+    assert same(list(reader[100:130:3]), sequential[100:130:3])
+    assert same(list(reader[250:150:-7]), sequential[250:150:-7])
+    reader.close()
+
+# Batch outputs are written to a partial file and renamed on success
+@needs_ffmpeg
+def test_batch(video, tmp_path):
+    batch = BrokenFFmpegBatch(workers=2)
+    batch.template(lambda path: (BrokenFFmpeg()
+        .input(path)
+        .custom("-frames:v", 10)
+        .output(tmp_path/f"{path.name}.mkv")
+    ), inputs=[video])
+    (job,) = batch.run()
+    assert job.ok and job.output.exists()
+    assert not list(tmp_path.glob("*.partial*"))
+
+# Frames written and reserved on the ring reach FFmpeg in order
+@needs_ffmpeg
+def test_ring_writer(tmp_path):
+    (width, height) = (8, 6)
+    frames = [numpy.full((height, width, 3), index, dtype=numpy.uint8) for index in range(20)]
+    output = tmp_path/"frames.rgb"
+    pipe = (BrokenFFmpeg()
+        .quiet()
+        .overwrite()
+        .format(FFmpegFormat.Rawvideo)
+        .pixel_format(FFmpegPixelFormat.RGB24)
+        .resolution(width, height)
+        .framerate(30)
+        .input("-")
+        .custom("-f", "rawvideo")
+        .output(output)
+    ).pipe(buffer=4)
+    for index, frame in enumerate(frames):
+        if (index % 2):
+            pipe.write(frame)
+        else:
+            numpy.asarray(pipe.reserve(size=frame.nbytes))[:] = frame.ravel()
+            pipe.commit()
+    pipe.close()
+    assert output.read_bytes() == b"".join(frame.tobytes() for frame in frames)
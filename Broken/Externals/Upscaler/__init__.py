@@ -1,16 +1,28 @@
 import contextlib
+import functools
+import io
+import itertools
+import os
 import shutil
 import tempfile
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Generator, Union
+from queue import Full, Queue
+from threading import Event
+from typing import Any, ClassVar, Deque, Generator, Iterable, List, Optional, Set, Tuple, Union
 
+import attrs
+import numpy
 import PIL
 from attr import define, field
 from loguru import logger as log
 from PIL.Image import Image
 
-from Broken import BrokenPath
+import Broken
+from Broken import BrokenPath, BrokenThread, image_hash
+from Broken.Externals.FFmpeg import BrokenFFmpeg, FFmpegFormat, FFmpegPixelFormat, FFmpegVideoCodec
 from Broken.Loaders import LoadableImage, LoaderImage
 
 
@@ -20,6 +32,8 @@ class BrokenUpscaler(ABC):
     height: int = field(default=0, converter=int)
     scale:  int = field(default=2, converter=int)
     passes: int = field(default=1, converter=int)
+    cache:  bool = field(default=False, metadata=dict(key=False), converter=bool)
+    """Reuse upscales of the same pixels and settings from a persistent cache, costs a hash per image"""
 
     @property
     def s(self) -> int:
@@ -81,6 +95,7 @@ class BrokenUpscaler(ABC):
         for key, val in config.items():
             setattr(self, key, val)
         self.__validate__()
+        self.warmup()
 
         # Load a Image out of the input or output, else Empty image
         Empty  = PIL.Image.new("RGB", (1, 1))
@@ -103,24 +118,455 @@ class BrokenUpscaler(ABC):
                 return iimage
             return output
 
-        # Upscale the image
-        with self.temp_image(input) as temp_input:
-            with self.temp_image(output) as temp_output:
+        # Same pixels and settings were upscaled before
+        key = (self.__cache_key__(iimage) if self.cache else None)
+        if (final := self.__cached__(key)) is not None:
+            log.minor(f"Using cached upscale of {iimage.size} to {target}", echo=echo)
 
-                # Upscale once then on top of itself for each pass
-                for _ in range(self.passes):
-                    self.__upscale__(input=temp_input, output=temp_output, echo=echo)
-                    input = temp_output
+        # Upscale the image, chaining passes between two lossless scratch files
+        else:
+            final = self.__upscale_image__(input, target, echo=echo)
+            self.__store__(key, final)
 
-                # Load the upscaled final image
-                final = PIL.Image.open(temp_output)
+        # Return the Path of the Image
+        if isinstance(output, Path):
+            final.save(output, quality=95)
+            return output
+        return final
+
+    def __upscale_image__(self, input: LoadableImage, target: tuple, *, echo: bool=True) -> Image:
+        """Run all passes of the backend on a single image, resized to the target size"""
+        size = 3*target[0]*target[1]
+        with self.temp_image(input) as source, self.temp_image(Image, size=size) as A, \
+            self.temp_image(Image, size=size) as B:
+            for index in range(self.passes):
+                self.__upscale__(input=source, output=(A, B)[index % 2], echo=echo)
+                source = (A, B)[index % 2]
+
+            # Load the upscaled final image, fully, as the file is deleted on exit
+            final = PIL.Image.open(source)
+            final.load()
+            if (final.size != target):
                 final = final.resize(target, PIL.Image.LANCZOS)
+            return final
+
+    # # Caching
+
+    _cache = None
+
+    CACHE_SIZE: ClassVar[int] = 4 * 2**30
+    """Maximum size of the persistent upscale results cache, in bytes"""
+
+    @staticmethod
+    def results() -> Any:
+        """Persistent on-disk cache of upscaled images, least recently used are evicted first"""
+        if BrokenUpscaler._cache is None:
+            import diskcache
+            BrokenUpscaler._cache = diskcache.Cache(
+                Broken.BROKEN.DIRECTORIES.CACHE/"BrokenUpscaler",
+                size_limit=BrokenUpscaler.CACHE_SIZE,
+                eviction_policy="least-recently-used",
+            )
+        return BrokenUpscaler._cache
+
+    def __cache_key__(self, image: Image) -> str:
+        """Content address of an upscale: the input pixels, upscaler class and all of its settings
+        (except fields with `metadata=dict(key=False)`, which don't change the result)"""
+        return f"{type(self).__name__}:{image_hash(image)}:{image.mode}:{image.size}:{self.__settings__()}"
+
+    def __settings__(self) -> str:
+        """All settings that change an upscale's result, as a stable string"""
+        settings = attrs.asdict(self, recurse=False, filter=lambda attribute, _: attribute.metadata.get("key", True))
+        return ",".join(f"{key}={value}" for key, value in sorted(settings.items()))
+
+    def __cached__(self, key: str) -> Optional[Image]:
+        """Get a previous upscale result from the cache, if enabled and present"""
+        if self.cache and (data := self.results().get(key)) is not None:
+            image = PIL.Image.open(io.BytesIO(data))
+            image.load()
+            return image
+        return None
+
+    def __store__(self, key: str, image: Image) -> None:
+        """Save an upscale result on the cache, as a fast to decode PNG"""
+        if not self.cache:
+            return
+        buffer = io.BytesIO()
+        image.save(buffer, format="png", compress_level=1)
+        self.results().set(key, buffer.getvalue())
+
+    # # Batch
+
+    def __upscale_directory__(self, input: Path, output: Path, *, echo: bool=True):
+        """Upscale all images of a directory into another with the same names as PNG"""
+        for image in sorted(input.iterdir()):
+            self.__upscale__(input=image, output=output/f"{Path(image).stem}.png", echo=echo)
+
+    def upscale_batch(self,
+        inputs: Union[Path, Iterable[LoadableImage]],
+        *,
+        batch:   int=64,
+        workers: int=2,
+        echo:    bool=True,
+        **config
+    ) -> Generator[Image, None, None]:
+        """
+        Upscale many images, yielding the results in order as they are ready
+        • Images are grouped in directories of `batch` images, each upscaled by a single backend
+          process (one model load), with up to `workers` of them running at once
+
+        Args:
+            `inputs`:  A directory of images or an iterable of any loadable images
+            `batch`:   Images per backend process
+            `workers`: Backend processes running in parallel
+
+        Returns:
+            Generator of upscaled PIL Images, in the same order as the inputs
+        """
+        for key, val in config.items():
+            setattr(self, key, val)
+        self.__validate__()
+        self.warmup()
+
+        if isinstance(inputs, (str, Path)) and (directory := BrokenPath(inputs)).is_dir():
+            inputs = sorted(path for path in directory.iterdir() if path.is_file())
+        inputs  = iter(inputs)
+        pending: Deque[Future] = deque()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+
+                # Keep the pool busy with the next batches, in order
+                while (len(pending) < workers) and (chunk := list(itertools.islice(inputs, batch))):
+                    pending.append(pool.submit(self.__batch__, chunk, echo=echo))
+                if not pending:
+                    break
+                yield from pending.popleft().result()
+
+    def __batch__(self, images: List[LoadableImage], *, echo: bool=True) -> List[Image]:
+        """Upscale a list of images with a single backend call per pass, skipping cached ones"""
+        images  = [LoaderImage(image).convert("RGB") for image in images]
+        if not self.cache:
+            return self.__batch_upscale__(images, echo=echo)
+        keys    = [self.__cache_key__(image) for image in images]
+        results = [self.__cached__(key) for key in keys]
+        missing = [index for index, result in enumerate(results) if result is None]
+
+        if missing:
+            for index, image in zip(missing, self.__batch_upscale__([images[index] for index in missing], echo=echo)):
+                self.__store__(keys[index], image)
+                results[index] = image
+        return results
+
+    def __batch_upscale__(self, images: List[Image], *, echo: bool=True) -> List[Image]:
+        """Upscale a list of RGB images through the backend, sharing directories between passes"""
+
+        # Both ping-pong directories are at most full of the last two passes' images
+        ratio = (self.scale**(self.passes - 1))**2
+        size  = sum(3*image.width*image.height for image in images) * ratio * (1 + self.scale**2)
+
+        with tempfile.TemporaryDirectory(dir=self.scratch(size)) as temp:
+            temp = BrokenPath(temp)
+            directories = [BrokenPath.mkdirs(temp/str(index), echo=False) for index in range(2)]
+
+            # Save inputs on the first directory, keeping their sizes for the final resize
+            sizes = []
+            for index, image in enumerate(images):
+                image.save(directories[0]/f"{index:08d}.png", compress_level=0)
+                sizes.append(self.output_size(*image.size))
+
+            # Ping-pong between the directories for each pass
+            for index in range(self.passes):
+                input, output = directories[index % 2], directories[(index + 1) % 2]
+                if index: BrokenPath.resetdir(output, echo=False)
+                self.__upscale_directory__(input=input, output=output, echo=echo)
+
+            # Load the final images fully before the directory is deleted
+            final = directories[self.passes % 2]
+            return [
+                PIL.Image.open(final/f"{index:08d}.png").convert("RGB").resize(size, PIL.Image.LANCZOS)
+                for index, size in enumerate(sizes)
+            ]
+
+    # # Tiled
+
+    def upscale_tiled(self,
+        input:  LoadableImage,
+        output: Path,
+        *,
+        tile:    int=512,
+        overlap: int=32,
+        workers: int=2,
+        band:    int=256,
+        echo:    bool=True,
+        **config
+    ) -> Path:
+        """
+        Upscale a very large image in overlapping tiles, bounding memory by the tile size
+        • Tiles are upscaled by a copy of this upscaler, without forced size nor results cache,
+          one backend process each, with up to `workers` of them running at once
+        • Seams are feather-blended with linear ramps over the overlap into memory mapped float32
+          accumulators on disk, normalized band-wise into a memory mapped uint8 output
+        • Only `.npy` (the raw (height, width, 3) array, see `numpy.load(mmap_mode="r")`) and `.ppm`
+          outputs are written band-wise with bounded memory. Other suffixes are encoded by PIL at
+          the end, which needs the whole output image in memory
+
+        Args:
+            `input`:   The input image to upscale
+            `output`:  The output path to save the upscaled image or array
+            `tile`:    Size of the square input tiles, in pixels
+            `overlap`: Pixels shared between neighbouring tiles, blended on the output
+            `workers`: Backend processes running in parallel
+            `band`:    Output rows normalized at once
+
+        Returns:
+            The output Path
+        """
+        for key, val in config.items():
+            setattr(self, key, val)
+        self.__validate__()
+        self.warmup()
 
-                # Return the Path of the Image
-                if isinstance(output, Path):
-                    final.save(output, quality=95)
-                    return output
-                return final
+        if not (0 <= overlap < tile):
+            raise ValueError(log.error(f"Tile overlap must be within [0, {tile}), got {overlap}"))
+
+        image = LoaderImage(input).convert("RGB")
+        width, height = image.size
+        target = self.output_size(width, height)
+        ratio  = (target[0]/width, target[1]/height)
+        worker = attrs.evolve(self, width=0, height=0, cache=False)
+        output = BrokenPath(output)
+
+        def spans(size: int) -> List[Tuple[int, int]]:
+            starts = [0]
+            while (starts[-1] + tile < size):
+                starts.append(starts[-1] + tile - overlap)
+            return [(start, min(start + tile, size)) for start in starts]
+
+        def ramp(size: int, start: int, end: int, total: int, axis: int) -> numpy.ndarray:
+            """Linear feathering weights of a tile's axis, only on sides shared with other tiles"""
+            weights = numpy.ones(size, dtype=numpy.float32)
+            fade = min(round(overlap*ratio[axis]), size)
+            if fade:
+                linear = numpy.linspace(0, 1, fade + 2, dtype=numpy.float32)[1:-1]
+                if (start > 0):
+                    weights[:fade] = numpy.minimum(weights[:fade], linear)
+                if (end < total):
+                    weights[-fade:] = numpy.minimum(weights[-fade:], linear[::-1])
+            return weights
+
+        def upscale(box: Tuple[int, int, int, int]) -> Tuple[Tuple[int, int, int, int], numpy.ndarray, numpy.ndarray]:
+            x0, y0, x1, y1 = box
+            X0, Y0 = round(x0*ratio[0]), round(y0*ratio[1])
+            X1, Y1 = round(x1*ratio[0]), round(y1*ratio[1])
+            result = worker.upscale(image.crop(box), echo=echo)
+            if (result.size != (X1 - X0, Y1 - Y0)):
+                result = result.resize((X1 - X0, Y1 - Y0), PIL.Image.LANCZOS)
+            weight = numpy.outer(ramp(Y1 - Y0, y0, y1, height, 1), ramp(X1 - X0, x0, x1, width, 0))
+            return ((X0, Y0, X1, Y1), weight, numpy.asarray(result.convert("RGB"), dtype=numpy.float32))
+
+        boxes = iter([(x0, y0, x1, y1) for (y0, y1) in spans(height) for (x0, x1) in spans(width)])
+        log.info(f"Upscaling {image.size} to {target} in tiles of {tile}px", echo=echo)
+
+        with tempfile.TemporaryDirectory() as temp:
+            temp   = Path(temp)
+            W, H   = target
+            color  = numpy.memmap(temp/"color.f32",  dtype=numpy.float32, mode="w+", shape=(H, W, 3))
+            weight = numpy.memmap(temp/"weight.f32", dtype=numpy.float32, mode="w+", shape=(H, W))
+
+            # Accumulate finished tiles, keeping at most 2*workers decoded ones in memory
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                pending: Set[Future] = set()
+                while True:
+                    while (len(pending) < 2*workers) and (box := next(boxes, None)):
+                        pending.add(pool.submit(upscale, box))
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        (X0, Y0, X1, Y1), weights, pixels = future.result()
+                        color[Y0:Y1, X0:X1] += pixels * weights[..., None]
+                        weight[Y0:Y1, X0:X1] += weights
+
+            # Normalize band-wise into the final uint8 array, mapped straight on the output if possible
+            if (output.suffix == ".npy"):
+                final = numpy.lib.format.open_memmap(output, mode="w+", dtype=numpy.uint8, shape=(H, W, 3))
+            elif (output.suffix == ".ppm"):
+                header = f"P6\n{W} {H}\n255\n".encode()
+                with open(output, "wb") as file:
+                    file.write(header)
+                    file.truncate(len(header) + H*W*3)
+                final = numpy.memmap(output, dtype=numpy.uint8, mode="r+", offset=len(header), shape=(H, W, 3))
+            else:
+                log.warning(f"Encoding ({output}) loads the whole {W}x{H} image in memory, use .npy or .ppm to avoid it")
+                final = numpy.memmap(temp/"final.u8", dtype=numpy.uint8, mode="w+", shape=(H, W, 3))
+
+            for row in range(0, H, band):
+                rows = slice(row, row + band)
+                final[rows] = numpy.clip(color[rows]/numpy.maximum(weight[rows], 1e-6)[..., None] + 0.5, 0, 255)
+            final.flush()
+
+            if (output.suffix not in (".npy", ".ppm")):
+                PIL.Image.fromarray(final).save(output, quality=95)
+            del color, weight, final
+
+        return output
+
+    # # Video
+
+    def upscale_video(self,
+        input:  Path,
+        output: Path,
+        *,
+        codec:   FFmpegVideoCodec=FFmpegVideoCodec.H264,
+        segment: int=600,
+        batch:   int=32,
+        workers: int=2,
+        buffer:  int=64,
+        echo:    bool=True,
+        **config
+    ) -> Optional[Path]:
+        """
+        Upscale a video, streaming decode, upscale and encode stages that run at the same time
+        • Frames are decoded by `BrokenFFmpeg.get_frames` into a bounded queue, upscaled through
+          `upscale_batch` and written to a BrokenFFmpeg pipe, one file every `segment` frames
+        • Finished segments are kept next to the output, a rerun with the same settings resumes
+          after the last one. All are concatenated at the end, copying the input's audio
+        • Each stage is bounded, at most `buffer` decoded and `workers*batch` upscaling frames
+
+        Args:
+            `input`:   The input video to upscale
+            `output`:  The output video path
+            `codec`:   Video codec of the segments and so the output
+            `segment`: Frames per resumable segment
+            `batch`:   Frames per backend process
+            `workers`: Backend processes running in parallel
+            `buffer`:  Decoded frames waiting to be upscaled
+
+        Returns:
+            The output Path, None if the input isn't a valid file
+        """
+        for key, val in config.items():
+            setattr(self, key, val)
+        self.__validate__()
+        self.warmup()
+
+        if not (input := BrokenPath(input).valid()):
+            return None
+        output    = BrokenPath(output)
+        framerate = BrokenFFmpeg.get_framerate(input, echo=False)
+        target    = self.output_size(*BrokenFFmpeg.get_resolution(input, echo=False))
+
+        # Segments are only valid for the same input and settings, start over otherwise
+        segments  = output.parent/f".{output.name}.segments"
+        signature = f"{type(self).__name__}:{BrokenFFmpeg.__identity__(input)}:{self.__settings__()}:{codec}:{segment}"
+        if (segments/"signature").exists() and ((segments/"signature").read_text() != signature):
+            BrokenPath.remove(segments, echo=False)
+        BrokenPath.mkdirs(segments, echo=False)
+        (segments/"signature").write_text(signature)
+
+        # Resume after the last fully encoded segment
+        done = 0
+        while (segments/f"{done:06d}.mkv").exists():
+            done += 1
+        if done:
+            log.info(f"Resuming upscale of ({input}) after {done} encoded segments", echo=echo)
+
+        # Decoding stage, feeding a bounded queue of images
+        frames = Queue(maxsize=buffer)
+        stop   = Event()
+        errors = []
+
+        def decode():
+            try:
+                for frame in BrokenFFmpeg.get_frames(input, skip=done*segment, echo=echo):
+                    image = PIL.Image.fromarray(frame)
+                    while not stop.is_set():
+                        with contextlib.suppress(Full):
+                            frames.put(image, timeout=0.1)
+                            break
+                    if stop.is_set():
+                        return
+            except Exception as error:
+                errors.append(error)
+            finally:
+                if not stop.is_set():
+                    frames.put(None)
+
+        def encoder(index: int) -> BrokenFFmpeg:
+            return (BrokenFFmpeg()
+                .quiet()
+                .overwrite()
+                .format(FFmpegFormat.Rawvideo)
+                .pixel_format(FFmpegPixelFormat.RGB24)
+                .resolution(*target)
+                .framerate(framerate)
+                .input("-")
+                .video_codec(codec)
+                .output(segments/f"{index:06d}.partial.mkv")
+            ).pipe()
+
+        # Upscaling and encoding stages, the pipe writes to FFmpeg on its own thread
+        decoder = BrokenThread.new(decode, daemon=True)
+        pipe, count, index = None, 0, done
+        try:
+            # Video frames are rarely repeated, skip hashing and storing them on the results cache
+            upscaler = attrs.evolve(self, cache=False)
+            for image in upscaler.upscale_batch(iter(frames.get, None), batch=batch, workers=workers, echo=echo):
+                if pipe is None:
+                    pipe = encoder(index)
+                pipe.write(numpy.asarray(image.convert("RGB")))
+                if (count := count + 1) == segment:
+                    self.__segment__(pipe, segments, index, echo=echo)
+                    pipe, count, index = None, 0, index + 1
+
+            # A failed decode ends the frames early, never commit the truncated segment
+            if errors:
+                raise RuntimeError(log.error(f"Decoding ({input}) failed, upscaled segments are kept to resume")) from errors[0]
+            if pipe is not None:
+                self.__segment__(pipe, segments, index, echo=echo)
+                pipe = None
+        finally:
+            stop.set()
+            if pipe is not None:
+                pipe.close()
+                (segments/f"{index:06d}.partial.mkv").unlink(missing_ok=True)
+        decoder.join()
+
+        # Concatenate all segments, copying the input's audio if any
+        with open(playlist := segments/"segments.txt", "w") as file:
+            for index in itertools.count():
+                if not (path := segments/f"{index:06d}.mkv").exists():
+                    break
+                file.write(f"file '{path.name}'\n")
+
+        (BrokenFFmpeg()
+            .quiet()
+            .overwrite()
+            .custom("-f", "concat", "-safe", "0")
+            .input(playlist)
+            .input(input)
+            .custom("-map", "0:v:0", "-map", "1:a?", "-c", "copy")
+            .output(output)
+        ).run()
+
+        BrokenPath.remove(segments, echo=False)
+        log.success(f"Upscaled video ({input}) to ({output}) at {target}", echo=echo)
+        return output
+
+    @staticmethod
+    def __segment__(pipe: Any, segments: Path, index: int, *, echo: bool=True) -> None:
+        """Finish a segment's encode and commit it as complete, an atomic rename on its directory"""
+        pipe.close()
+        partial = segments/f"{index:06d}.partial.mkv"
+
+        # Only successful encodes are trusted on resume
+        if (pipe.ffmpeg.returncode != 0):
+            partial.unlink(missing_ok=True)
+            raise RuntimeError(log.error(f"Encoding upscaled segment {index} failed with code {pipe.ffmpeg.returncode}"))
+
+        os.replace(partial, segments/f"{index:06d}.mkv")
+        log.minor(f"Encoded upscaled segment {index}", echo=echo)
 
     @abstractmethod
     def __validate__(self):
@@ -128,35 +574,69 @@ class BrokenUpscaler(ABC):
         Validate parameters for the current upscaler
         """
 
+    def warmup(self) -> None:
+        """Verify the backend is ready to run (binaries, models), failing fast before any work"""
+        ...
+
+    NATIVE = {".png", ".jpg", ".jpeg", ".webp"}
+    """Image formats the backends read directly, that need no temporary copy"""
+
+    @staticmethod
+    @functools.lru_cache
+    def shared_memory() -> Optional[Path]:
+        """The in memory (tmpfs) /dev/shm directory if usable"""
+        if (shm := Path("/dev/shm")).is_dir() and os.access(shm, os.W_OK):
+            return BrokenPath(shm)
+        return None
+
+    @staticmethod
+    def scratch(size: int=0) -> Path:
+        """
+        Directory for intermediate images, in memory (tmpfs) only when it comfortably fits `size`
+        bytes: at most half its free space, leaving room for concurrent work, else the temp dir
+        """
+        if (shm := BrokenUpscaler.shared_memory()) and (0 < 2*size <= shutil.disk_usage(shm).free):
+            return shm
+        return BrokenPath(tempfile.gettempdir())
+
     @contextlib.contextmanager
     def temp_image(self,
         image: LoadableImage,
-        format="jpg"
+        format="png",
+        size: int=0,
     ) -> Generator[Path, None, None]:
         """
         Get a temporary Path to a Image
-        • Saves an Image object or copies a Path to a temporary file
-        • Yields the Path to the temporary file
+        • Files of formats the backends read are used as they are, without a copy
+        • Saves an Image object to a temporary file, losslessly and uncompressed on PNG
+        • Yields the Path to the temporary file, on the scratch directory
 
         Args:
-            `image`:  The image to save or copy
+            `image`:  The image to save or use
             `format`: The format of the temporary file
+            `size`:   Expected bytes of the file, when `image` is the `Image` placeholder
 
         Returns:
             The Path to the temporary file, deleted on context exit
         """
+        if isinstance(image, (str, Path)) and (path := BrokenPath(image).valid()) \
+            and (path.suffix.lower() in self.NATIVE):
+            yield path
+            return
+
         image = LoaderImage(image) or image
+        size  = (3*image.width*image.height) if isinstance(image, Image) else size
+        file  = tempfile.NamedTemporaryFile(delete=False, suffix=f".{format}", dir=self.scratch(size))
+        file  = BrokenPath(file.name)
+        options = dict(compress_level=0) if (format == "png") else dict(quality=95)
 
         try:
-            file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{format}")
-            file = BrokenPath(file.name)
             if isinstance(image, Image):
-                image.save(file, quality=95)
+                image.save(file, **options)
             elif image is Image:
                 pass
             elif Path(image).exists():
-                PIL.Image.open(image).save(file, quality=95)
+                PIL.Image.open(image).save(file, **options)
             yield file
         finally:
-            file.unlink()
-
+            file.unlink(missing_ok=True)
@@ -0,0 +1,96 @@
+from . import *
+
+import shutil
+
+import pytest
+
+from Broken import shell
+
+
+# Backend-free upscaler, a nearest neighbour resize per backend call
+@define
+class Nearest(BrokenUpscaler):
+    calls: int = field(default=0, metadata=dict(key=False))
+
+    def __upscale__(self, input: Path, output: Path, *, echo: bool=True):
+        self.calls += 1
+        image = PIL.Image.open(input)
+        image.resize((image.width*self.scale, image.height*self.scale), PIL.Image.NEAREST).save(output)
+
+    def __validate__(self):
+        ...
+
+@pytest.fixture
+def images() -> List[Image]:
+    return [PIL.Image.new("RGB", (8, 6), color=(index, 0, 0)) for index in range(5)]
+
+# Batches go through a directory per pass, keeping the image names
+def test_batch(images):
+    upscaler = Nearest(cache=False, passes=2)
+    results  = list(upscaler.upscale_batch(images, batch=2, echo=False))
+    assert [image.size for image in results] == [(32, 24)]*len(images)
+    assert [image.getpixel((0, 0))[0] for image in results] == list(range(len(images)))
+    assert upscaler.calls == 2*len(images)
+
+# Disabled caches mustn't hash anything
+def test_batch_uncached(images, monkeypatch):
+    monkeypatch.setattr(Nearest, "__cache_key__", lambda *args: pytest.fail("Hashed an image"))
+    results = list(Nearest(cache=False).upscale_batch(images, batch=2, echo=False))
+    assert [image.size for image in results] == [(16, 12)]*len(images)
+    assert [image.getpixel((0, 0))[0] for image in results] == list(range(len(images)))
+
+# The results cache is opt-in, and then skips the backend for known images
+def test_cache(images, tmp_path, monkeypatch):
+    import diskcache
+    monkeypatch.setattr(BrokenUpscaler, "_cache", diskcache.Cache(tmp_path/"cache"))
+    cached = Nearest(cache=True)
+    assert cached.upscale(images[0], echo=False).size == (16, 12)
+    assert cached.upscale(images[0], echo=False).size == (16, 12)
+    assert cached.calls == 1
+
+    monkeypatch.setattr(Nearest, "__cache_key__", lambda *args: pytest.fail("Hashed an image"))
+    assert Nearest().upscale(images[0], echo=False).size == (16, 12)
+
+# Tiles are rarely repeated, they mustn't be hashed even with the cache enabled
+def test_tiled_uncached(tmp_path, monkeypatch):
+    monkeypatch.setattr(Nearest, "__cache_key__", lambda *args: pytest.fail("Hashed a tile"))
+    image  = PIL.Image.new("RGB", (40, 30), color=(10, 20, 30))
+    output = Nearest(cache=True).upscale_tiled(image, tmp_path/"tiled.npy", tile=16, overlap=4, echo=False)
+    assert numpy.load(output).shape == (60, 80, 3)
+    assert (numpy.load(output) == (10, 20, 30)).all()
+
+# -------------------------------------------------------------------------------------------------|
+# Video
+
+needs_ffmpeg = pytest.mark.skipif(not shutil.which("ffmpeg"), reason="FFmpeg binary not found")
+
+@pytest.fixture
+def video(tmp_path) -> Path:
+    path = tmp_path/"testsrc.mp4"
+    shell("ffmpeg", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", "testsrc=size=64x48:rate=30",
+        "-frames:v", 300, "-g", 30, "-pix_fmt", "yuv420p", path, echo=False)
+    return path
+
+# Decoding errors fail the upscale, which then resumes after the complete segments
+@needs_ffmpeg
+def test_video_resume(video, tmp_path, monkeypatch):
+    output   = tmp_path/"upscaled.mp4"
+    segments = tmp_path/f".{output.name}.segments"
+    upscaler = Nearest(cache=False)
+    get_frames = BrokenFFmpeg.get_frames
+
+    def failing(*args, **kwargs):
+        yield from itertools.islice(get_frames(*args, **kwargs), 150)
+        raise OSError("Broken decoder")
+
+    monkeypatch.setattr(BrokenFFmpeg, "get_frames", failing)
+    with pytest.raises(RuntimeError):
+        upscaler.upscale_video(video, output, segment=100, batch=16, echo=False)
+    assert sorted(path.name for path in segments.glob("*.mkv")) == ["000000.mkv"]
+    assert not output.exists()
+
+    monkeypatch.setattr(BrokenFFmpeg, "get_frames", get_frames)
+    upscaler.upscale_video(video, output, segment=100, batch=16, echo=False)
+    assert BrokenFFmpeg.get_resolution(output) == (128, 96)
+    assert BrokenFFmpeg.count_frames(output, exact=True, echo=False).frames == 300
@@ -1,33 +1,93 @@
+import contextlib
+import functools
+import os
 from abc import ABC, abstractmethod
 from pathlib import Path
 from subprocess import DEVNULL
+from threading import Condition
+from typing import Callable, Generator, List, Optional, Set
 
-from attr import define, field
+from attr import Factory, define, field
+from loguru import logger as log
 
 from Broken import BrokenEnum, BrokenPath, BrokenPlatform, shell
 from Broken.Externals.Upscaler import BrokenUpscaler
 
 
+@define
+class BrokenCores:
+    """Hands out disjoint sets of CPU cores to concurrent processes, blocking until enough are free"""
+    free: Set[int] = Factory(lambda: set(
+        os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else range(os.cpu_count())
+    ))
+    total: int = None
+    condition: Condition = Factory(Condition)
+
+    def __attrs_post_init__(self):
+        self.total = len(self.free)
+
+    def acquire(self, count: int) -> Set[int]:
+        """Take `count` free cores (at most all of them), waiting for other processes to release"""
+        count = max(1, min(count, self.total))
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.free) >= count)
+            cores = set(sorted(self.free)[:count])
+            self.free -= cores
+            return cores
+
+    def release(self, cores: Set[int]) -> None:
+        """Give back cores previously acquired, waking up waiting processes"""
+        with self.condition:
+            self.free |= cores
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def hold(self, count: int) -> Generator[Set[int], None, None]:
+        """Acquire cores for the duration of the context"""
+        cores = self.acquire(count)
+        try:
+            yield cores
+        finally:
+            self.release(cores)
+
+CORES = BrokenCores()
+"""Shared core allocator of all NCNN upscaler processes"""
+
 @define
 class BrokenUpscalerNCNN(BrokenUpscaler, ABC):
     noise_level:  int  = field(default=1, converter=int)
     tile_size:    int  = field(default=0, converter=int)
-    gpu:          int  = field(default=0, converter=int)
-    load_threads: int  = field(default=1, converter=int)
-    proc_threads: int  = field(default=1, converter=int)
-    save_threads: int  = field(default=1, converter=int)
+    gpu:          int  = field(default=0, metadata=dict(key=False), converter=int)
+    load_threads: int  = field(default=1, metadata=dict(key=False), converter=int)
+    proc_threads: int  = field(default=1, metadata=dict(key=False), converter=int)
+    save_threads: int  = field(default=1, metadata=dict(key=False), converter=int)
     cpu:          bool = field(default=0, converter=bool)
     tta:          bool = field(default=0, converter=bool)
-
-    def preexec_fn(self):
-        import os
-        import random
-        import resource
-
-        # Make the process only use one random core
-        core = random.choice(range(os.cpu_count()))
-        os.sched_setaffinity(0, {core})
-        resource.setrlimit(resource.RLIMIT_CPU, (1, 1))
+    affinity:     bool = field(default=True, metadata=dict(key=False), converter=bool)
+    cpu_limit:    Optional[int] = field(default=None, metadata=dict(key=False))
+
+    def preexec_fn(self, cores: Set[int]=None) -> Optional[Callable]:
+        """Make a child process setup function pinning it to `cores` and applying resource limits"""
+        if BrokenPlatform.OnWindows:
+            return None
+
+        def preexec():
+            import resource
+            if cores and hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(0, cores)
+            if self.cpu_limit:
+                resource.setrlimit(resource.RLIMIT_CPU, (self.cpu_limit, self.cpu_limit))
+
+        return preexec
+
+    @contextlib.contextmanager
+    def __process__(self) -> Generator[Optional[Callable], None, None]:
+        """Hold `proc_threads` cores for a backend process, yielding its preexec_fn"""
+        if not self.affinity:
+            yield self.preexec_fn()
+            return
+        with CORES.hold(self.proc_threads) as cores:
+            yield self.preexec_fn(cores)
 
     @property
     def n(self) -> int:
@@ -91,13 +151,56 @@ class BrokenUpscalerNCNN(BrokenUpscaler, ABC):
     def _binary_name() -> str:
         ...
 
-    def binary(self) -> Path:
-        if (binary := BrokenPath.which(self._binary_name())):
+    @staticmethod
+    @abstractmethod
+    def _model_path(root: Path, model: BrokenEnum) -> Path:
+        """Path of a model's file or directory relative to a models root"""
+        ...
+
+    def __upscale_directory__(self, input: Path, output: Path, *, echo: bool=True):
+        """NCNN binaries take whole directories, loading the model only once for all images"""
+        self.__upscale__(input=input, output=output, echo=echo)
+
+    @classmethod
+    @functools.lru_cache
+    def binary(cls) -> Path:
+        """Find or download the backend binary, resolved only once per upscaler class"""
+        if (binary := BrokenPath.which(cls._binary_name())):
             return BrokenPath(binary)
-        DOWNLOAD = self._base_download().format(BrokenPlatform.Name.replace("linux", "ubuntu"))
-        EXECUTABLE = self._binary_name() + (".exe"*BrokenPlatform.OnWindows)
+        DOWNLOAD = cls._base_download().format(BrokenPlatform.Name.replace("linux", "ubuntu"))
+        EXECUTABLE = cls._binary_name() + (".exe"*BrokenPlatform.OnWindows)
         return BrokenPath.make_executable(next(BrokenPath.get_external(DOWNLOAD).rglob(EXECUTABLE)))
 
+    @classmethod
+    def _model_roots(cls) -> List[Path]:
+        """Where models may be: next to the binary (or its symlink target), or a system install"""
+        binary = cls.binary()
+        roots  = (binary.parent, binary.resolve().parent, binary.parent.parent/"share"/cls._binary_name())
+        return list(dict.fromkeys(roots))
+
+    @classmethod
+    @functools.lru_cache
+    def model_path(cls, model: BrokenEnum) -> Optional[Path]:
+        """Find a model's path on any of the roots, None if not found"""
+        for root in cls._model_roots():
+            if (path := cls._model_path(root, model)).exists():
+                return path
+        return None
+
+    def warmup(self) -> None:
+        self.__verify__(self.model)
+
+    @classmethod
+    @functools.lru_cache
+    def __verify__(cls, model: BrokenEnum) -> None:
+        """Check once that the binary is executable and the model exists for it"""
+        binary = cls.binary()
+        if not (binary.is_file() and os.access(binary, os.X_OK)):
+            raise FileNotFoundError(log.error(f"{cls.__name__} binary is not executable: {binary}"))
+        if cls.model_path(model) is None:
+            searched = ", ".join(str(cls._model_path(root, model)) for root in cls._model_roots())
+            raise FileNotFoundError(log.error(f"{cls.__name__} model {model.value} not found, searched: {searched}"))
+
 # -------------------------------------------------------------------------------------------------|
 
 class BrokenWaifu2xModel(BrokenEnum):
@@ -117,6 +220,10 @@ class BrokenWaifu2x(BrokenUpscalerNCNN):
     def _binary_name() -> str:
         return "waifu2x-ncnn-vulkan"
 
+    @staticmethod
+    def _model_path(root: Path, model: BrokenWaifu2xModel) -> Path:
+        return (root/model.value)
+
     def __validate__(self):
         if not all(things := (
             self.noise_level in {-1, 0, 1, 2, 3},
@@ -131,22 +238,23 @@ class BrokenWaifu2x(BrokenUpscalerNCNN):
             raise ValueError(f"Invalid parameters for {self.__class__.__name__}: {things}")
 
     def __upscale__(self, input: Path, output: Path, *, echo: bool=True):
-        shell(
-            self.binary(),
-            "-i", input,
-            "-o", output,
-            "-n", self.noise_level,
-            "-s", self.scale,
-            "-t", self.tile_size,
-            "-g", self.gpu if not self.cpu else -1,
-            "-j", f"{self.load_threads}:{self.proc_threads}:{self.save_threads}",
-            "-x"*self.tta,
-            # "-m", self.model.value, # Fixme: Doko?
-            stderr=DEVNULL,
-            preexec_fn=self.preexec_fn,
-            cwd=self.binary().parent,
-            echo=echo,
-        )
+        with self.__process__() as preexec:
+            shell(
+                self.binary(),
+                "-i", input,
+                "-o", output,
+                "-n", self.noise_level,
+                "-s", self.scale,
+                "-t", self.tile_size,
+                "-g", self.gpu if not self.cpu else -1,
+                "-j", f"{self.load_threads}:{self.proc_threads}:{self.save_threads}",
+                "-x"*self.tta,
+                "-m", self.model_path(self.model),
+                stderr=DEVNULL,
+                preexec_fn=preexec,
+                cwd=self.binary().parent,
+                echo=echo,
+            )
 
 # -------------------------------------------------------------------------------------------------|
 
@@ -168,6 +276,10 @@ class BrokenRealEsrgan(BrokenUpscalerNCNN):
     def _binary_name() -> str:
         return "realesrgan-ncnn-vulkan"
 
+    @staticmethod
+    def _model_path(root: Path, model: BrokenRealEsrganModel) -> Path:
+        return (root/"models"/f"{model.value}.param")
+
     def __validate__(self):
         if not all(things := (
             self.passes >= 1,
@@ -182,20 +294,22 @@ class BrokenRealEsrgan(BrokenUpscalerNCNN):
             raise ValueError(f"Invalid parameters for {self.__class__.__name__}: {things}")
 
     def __upscale__(self, input: Path, output: Path, *, echo: bool=True):
-        shell(
-            self.binary(),
-            "-i", input,
-            "-o", output,
-            "-n", self.model.value,
-            "-s", self.scale,
-            "-t", self.tile_size,
-            "-g", self.gpu,
-            "-j", f"{self.load_threads}:{self.proc_threads}:{self.save_threads}",
-            "-x"*self.tta,
-            stderr=DEVNULL,
-            preexec_fn=self.preexec_fn,
-            cwd=self.binary().parent,
-            echo=echo,
-        )
+        with self.__process__() as preexec:
+            shell(
+                self.binary(),
+                "-i", input,
+                "-o", output,
+                "-n", self.model.value,
+                "-m", self.model_path(self.model).parent,
+                "-s", self.scale,
+                "-t", self.tile_size,
+                "-g", self.gpu,
+                "-j", f"{self.load_threads}:{self.proc_threads}:{self.save_threads}",
+                "-x"*self.tta,
+                stderr=DEVNULL,
+                preexec_fn=preexec,
+                cwd=self.binary().parent,
+                echo=echo,
+            )
 
 # -------------------------------------------------------------------------------------------------|
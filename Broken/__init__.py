@@ -83,7 +83,13 @@ from Broken.Core.BrokenPlatform import BrokenPlatform
 from Broken.Core.BrokenProfiler import BrokenProfiler, BrokenProfilerEnum
 from Broken.Core.BrokenProject import BrokenApp, BrokenProject
 from Broken.Core.BrokenResolution import BrokenResolution
-from Broken.Core.BrokenScheduler import BrokenScheduler, BrokenTask
+from Broken.Core.BrokenScheduler import (
+    BrokenScheduler,
+    BrokenTask,
+    BrokenTaskExecutor,
+    BrokenTaskOverlap,
+    BrokenTaskStats,
+)
 from Broken.Core.BrokenSpinner import BrokenSpinner
 from Broken.Core.BrokenThread import BrokenThread, BrokenThreadPool
 from Broken.Core.BrokenTorch import BrokenTorch, TorchFlavor